@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+##
+# Offline crawl benchmark. Replays a fixture directory recorded with CSA_RECORD_FIXTURES through a local ReplayServer,
+# runs a full scrape against it from a scratch copy of the bot and reports firms/sec, requests/firm, parse time per
+# response and the scraper's peak RSS.
+#
+# usage: python benchmarks/crawl_benchmark.py <fixture directory>
+
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import resource
+import tempfile
+import subprocess
+
+bot_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "canadian_securities_admins")
+sys.path.insert(0, bot_directory)
+
+from asp_response import AspResponse
+from replay import ReplayServer
+
+
+##
+# time_parsing will parse every recorded postback the way the scraper does
+#
+# @param fixture_directory The fixture directory
+#
+# @return A tuple of the number of responses parsed and the mean seconds per response
+
+def time_parsing(fixture_directory):
+    bodies = []
+    for path in glob.glob(os.path.join(fixture_directory, "*.json")):
+        with open(path, "r") as fixture_file:
+            fixture = json.load(fixture_file)
+
+        if fixture['method'] == "POST":
+            bodies.append(fixture['body'])
+
+    started = time.time()
+    for body in bodies:
+        response = AspResponse(body)
+        response.view_state
+        response.record_count
+        if 'gridview_style' in response.html:
+            response.result_table()
+        else:
+            response.details_div()
+
+    elapsed = time.time() - started
+    return len(bodies), elapsed / max(1, len(bodies))
+
+
+##
+# run_crawl will scrape the replay server from a scratch copy of the bot
+#
+# @param server The running ReplayServer
+#
+# @return A tuple of the number of firms scraped, the number of records and the seconds taken
+
+def run_crawl(server):
+    scratch = tempfile.mkdtemp()
+    work_directory = os.path.join(scratch, "bot")
+    shutil.copytree(bot_directory, work_directory, ignore=shutil.ignore_patterns("data", "output", "*.pyc"))
+    os.mkdir(os.path.join(work_directory, "data"))
+
+    env = dict(os.environ,
+               CSA_URL_START=server.url(),
+               CSA_RATE_PAGE="0",
+               CSA_RATE_DETAIL="0",
+               CSA_RATE_INDIVIDUAL="0")
+
+    try:
+        started = time.time()
+        output = subprocess.check_output([sys.executable, "scraper.py"], cwd=work_directory, env=env)
+        elapsed = time.time() - started
+    finally:
+        shutil.rmtree(scratch)
+
+    firms = set()
+    records = 0
+    for line in output.splitlines():
+        if line.strip():
+            firms.add(json.loads(line)['firm'])
+            records += 1
+
+    return len(firms), records, elapsed
+
+
+def main():
+    if len(sys.argv) < 2:
+        print "usage: python benchmarks/crawl_benchmark.py <fixture directory>"
+        sys.exit(1)
+
+    fixture_directory = sys.argv[1]
+
+    responses, parse_time = time_parsing(fixture_directory)
+    print "parse: %d responses, %.2f ms/response" % (responses, parse_time * 1000)
+
+    server = ReplayServer(fixture_directory)
+    server.start()
+
+    firms, records, elapsed = run_crawl(server)
+    requests_made = sum(server.hits.values())
+    server.shutdown()
+
+    # ru_maxrss is in kilobytes on linux
+    peak_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024.0
+
+    print "crawl: %d firms, %d records in %.2fs" % (firms, records, elapsed)
+    print "firms/sec: %.2f" % (firms / elapsed if elapsed > 0 else 0)
+    print "requests/firm: %.2f" % (requests_made / float(max(1, firms)))
+    print "peak rss: %.1f MB" % peak_rss
+    print "requests by target: " + json.dumps(server.hits, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
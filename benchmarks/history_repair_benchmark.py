@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+##
+# History repair benchmark. Checks repair_history against the per-match str.replace loop (firms) and re.sub
+# (individuals) it replaced, over every firm and individual history response in a fixture directory plus synthetic
+# responses with a growing number of revoked categories, and reports the time each takes. Any response where the two
+# disagree is listed and fails the run. tests/test_history_repair.py checks the same on the committed history panels.
+#
+# usage: python benchmarks/history_repair_benchmark.py [fixture directory] [revocations...]
+
+import os
+import re
+import sys
+import glob
+import json
+import time
+
+bot_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "canadian_securities_admins")
+sys.path.insert(0, bot_directory)
+
+from asp_response import AspResponse, repair_history
+
+
+legacy_firm_regex = re.compile(r'<div id="ctl[0-9]+_bodyContent_dlstFirmLocations_ctl[0-9]+_rptCategories_ctl[0-9]+'
+                               r'_pnlRevocationDate">(.*?</div>.*?)</div>', re.DOTALL)
+legacy_individual_regex = re.compile(r'<div id="ctl[0-9]+_bodyContent_dlstIndLocations_ctl[0-9]+_dlstIndFirms_ctl[0-9]+'
+                                     r'_rptCategories_ctl[0-9]+_pnlRevocationDate">', re.DOTALL)
+
+
+def legacy_repair_firm(markup):
+    for match in legacy_firm_regex.finditer(markup):
+        markup = markup.replace(match.group(0), match.group(1))
+
+    return markup
+
+
+def legacy_repair_individual(markup):
+    return re.sub(legacy_individual_regex, r"", markup)
+
+
+##
+# load_corpus will collect the history responses recorded in a fixture directory
+#
+# @param fixture_directory The fixture directory
+#
+# @return A list of (name, kind, panel markup) tuples
+
+def load_corpus(fixture_directory):
+    corpus = []
+    for path in sorted(glob.glob(os.path.join(fixture_directory, "*.json"))):
+        with open(path, "r") as fixture_file:
+            fixture = json.load(fixture_file)
+
+        if fixture['target'].endswith("lbtnShowFirmHistorical"):
+            corpus.append((os.path.basename(path), "firm", AspResponse(fixture['body']).html))
+        elif fixture['target'].endswith("lbtnShowIndHistorical"):
+            corpus.append((os.path.basename(path), "individual", AspResponse(fixture['body']).html))
+
+    return corpus
+
+
+##
+# synthetic_history will build a firm history panel with a number of revoked categories
+#
+# @param revocations The number of revoked categories
+#
+# @return The panel markup
+
+def synthetic_history(revocations):
+    parts = ['<div id="ctl00_bodyContent_divSearchResults"><table id="ctl00_bodyContent_dlstFirmLocations">']
+    for i in range(revocations):
+        parts.append('<tr><td><div class="sectiontitle"><span>Ontario</span></div><table><tbody>'
+                     '<tr><th>Category</th><td>Exempt Market Dealer</td></tr>'
+                     '<div id="ctl00_bodyContent_dlstFirmLocations_ctl%02d_rptCategories_ctl00_pnlRevocationDate">'
+                     '<tr><th>To</th><td><div>January 1, 2010</div></td></tr></div>'
+                     '<tr><th>Status</th><td>Revoked</td></tr></tbody></table></td></tr>' % i)
+
+    parts.append('</table></div>')
+    return "".join(parts)
+
+
+def time_repair(fn, markup, repeat):
+    started = time.time()
+    for _ in range(repeat):
+        fn(markup)
+
+    return (time.time() - started) / repeat
+
+
+def main():
+    fixture_directory = sys.argv[1] if len(sys.argv) > 1 and os.path.isdir(sys.argv[1]) else None
+    revocations = [int(count) for count in sys.argv[2 if fixture_directory is not None else 1:]] or [10, 100, 1000]
+
+    corpus = load_corpus(fixture_directory) if fixture_directory is not None else []
+    corpus += [("synthetic-%d" % count, "firm", synthetic_history(count)) for count in revocations]
+
+    mismatches = []
+    for name, kind, markup in corpus:
+        legacy = legacy_repair_firm if kind == "firm" else legacy_repair_individual
+        if repair_history(markup) != legacy(markup):
+            mismatches.append(name)
+            continue
+
+        repeat = 3 if len(markup) > 1000000 else 20
+        legacy_time = time_repair(legacy, markup, repeat)
+        repair_time = time_repair(repair_history, markup, repeat)
+        print "%-48s %-10s %8d bytes  legacy %9.2f ms  repair %7.2f ms" % (name, kind, len(markup), legacy_time * 1000,
+                                                                            repair_time * 1000)
+
+    if mismatches:
+        print "repair differs from the legacy fix on: " + ", ".join(mismatches)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+##
+# Throughput benchmark for licence_transformer.py. Generates a synthetic scraper dump and pipes it through the
+# transformer as a subprocess at each requested process count, reporting records per second.
+#
+# usage: python benchmarks/licence_transformer_benchmark.py [records] [process counts...]
+
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+import subprocess
+
+
+transformer = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "canadian_securities_admins",
+                           "licence_transformer.py")
+
+months = ["January", "February", "March", "April", "May", "June", "July", "August", "September", "October",
+          "November", "December"]
+
+
+def generate_dump(path, count):
+    dates = ["%s %d, %d" % (random.choice(months), random.randint(1, 28), random.randint(1990, 2015))
+             for _ in range(500)]
+
+    with open(path, "w") as dump:
+        for i in range(count):
+            record = {'firm': "FIRM %d INC." % (i / 5),
+                      'all_jurisdictions': "Alberta, Ontario, Qu\xc3\xa9bec".decode("utf-8"),
+                      'jurisdiction': random.choice(["Alberta", "Ontario", "British Columbia"]),
+                      'sample_date': "2015-01-01T00:00:00.000000",
+                      'source_url': "http://www.securities-administrators.ca/nrs/nrsearchResult.aspx?ID=1325",
+                      'historical_names': "",
+                      'category': "Exempt Market Dealer",
+                      'status': "Active",
+                      'contact': "Head Office 100 Front Street, Suite 400, Toronto ON Phone: (416) 555-0100",
+                      'from': random.choice(dates)}
+
+            if i % 3 == 0:
+                record['to'] = random.choice(dates)
+
+            dump.write(json.dumps(record) + "\n")
+
+
+def run(path, processes):
+    env = dict(os.environ, CSA_TRANSFORM_PROCESSES=str(processes))
+
+    with open(path, "r") as dump, open(os.devnull, "w") as devnull:
+        started = time.time()
+        subprocess.check_call([sys.executable, transformer], stdin=dump, stdout=devnull, env=env,
+                              cwd=os.path.dirname(transformer))
+        return time.time() - started
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    process_counts = [int(arg) for arg in sys.argv[2:]] or [1, 2, 4]
+
+    handle, path = tempfile.mkstemp(suffix=".dump")
+    os.close(handle)
+
+    try:
+        generate_dump(path, count)
+        size = os.path.getsize(path) / (1024.0 * 1024.0)
+        print "%d records, %.1f MB" % (count, size)
+
+        for processes in process_counts:
+            elapsed = run(path, processes)
+            print "processes=%d: %.2fs, %.0f records/s, %.1f MB/s" % (processes, elapsed, count / elapsed,
+                                                                       size / elapsed)
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
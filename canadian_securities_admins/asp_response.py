@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+
+import re
+import urllib
+import metrics
+
+# bs4 and the parser it's given are only looked up the first time any html is parsed
+html_parser = None
+
+
+record_count_regex = re.compile(r'There are (\d+) records found')
+result_table_regex = re.compile(r'<table class="gridview_style".*?</table>', re.DOTALL)
+details_div_regex = re.compile(r'<div id="ctl00_bodyContent_divSearchResults".*</div>', re.DOTALL)
+hidden_field_regex = re.compile(r'\|hiddenField\|([^|]*)\|([^|]*)\|')
+registrations_regex = re.compile(r'<table[^>]*id="ctl00_bodyContent_dlst(?:Firm|Ind)Locations"')
+table_tag_regex = re.compile(r'<(/?)table\b', re.IGNORECASE)
+
+# Revocation date panels break the tables of history responses. On firms the panel's wrapper is dropped along with the
+# first closing div after its contents, on individuals only the opening tag is.
+broken_history_regex = re.compile(r'<div id="ctl[0-9]+_bodyContent_(?:'
+                                  r'dlstFirmLocations_ctl[0-9]+_rptCategories_ctl[0-9]+_pnlRevocationDate">'
+                                  r'(.*?</div>.*?)</div>|'
+                                  r'dlstIndLocations_ctl[0-9]+_dlstIndFirms_ctl[0-9]+_rptCategories_ctl[0-9]+'
+                                  r'_pnlRevocationDate">)', re.DOTALL)
+
+
+##
+# parse_html will build a bs4 document from a fragment of markup
+#
+# @param markup The html to parse
+#
+# @return The bs4 object
+
+def parse_html(markup):
+    global html_parser
+    if html_parser is None:
+        html_parser = load_parser()
+
+    with metrics.timed("parse.html"):
+        return html_parser[0](markup, html_parser[1])
+
+
+##
+# load_parser will pick the html parser, preferring lxml when it's installed as it's several times faster than the pure
+# python parser on these pages
+#
+# @return The BeautifulSoup class and the name of the parser to give it
+
+def load_parser():
+    from bs4 import BeautifulSoup
+
+    try:
+        import lxml
+        return BeautifulSoup, "lxml"
+    except ImportError:
+        return BeautifulSoup, "html.parser"
+
+
+##
+# AspResponse is a parsed MicrosoftAjax async postback response. The delta is a sequence of length|type|id|content|
+# frames which is split once, in a single pass, the first time anything is asked of the response. Hidden fields, the
+# update panel html, the record count and the bs4 documents are then derived lazily and cached, so nothing scans the
+# multi-hundred-KB view state more than once and only the panel markup ever reaches the html parser.
+
+class AspResponse(object):
+
+    def __init__(self, text):
+        self.text = text
+        self._hidden_fields = None
+        self._panels = None
+        self._html = None
+        self._view_state = None
+        self._record_count = None
+        self._result_table = None
+        self._repaired_html = None
+
+    def _split(self):
+        if self._hidden_fields is not None:
+            return
+
+        with metrics.timed("parse.split"):
+            self._split_frames()
+
+    ##
+    # _split_frames walks the delta frames, falling back to a regex scan if the framing isn't what we expect (e.g. an
+    # error page or a length that doesn't line up with the content)
+
+    def _split_frames(self):
+        hidden_fields = {}
+        panels = []
+        text = self.text
+        end = len(text)
+        pos = 0
+
+        try:
+            while pos < end:
+                length_end = text.index('|', pos)
+                type_end = text.index('|', length_end + 1)
+                id_end = text.index('|', type_end + 1)
+
+                content_start = id_end + 1
+                content_end = content_start + int(text[pos:length_end])
+                if content_end >= end or text[content_end] != '|':
+                    raise ValueError("Delta frame length does not match its content")
+
+                frame_type = text[length_end + 1:type_end]
+                if frame_type == "hiddenField":
+                    hidden_fields[text[type_end + 1:id_end]] = text[content_start:content_end]
+                elif frame_type == "updatePanel":
+                    panels.append(text[content_start:content_end])
+
+                pos = content_end + 1
+
+        except ValueError:
+            hidden_fields = dict(hidden_field_regex.findall(text))
+            panels = [text]
+
+        self._hidden_fields = hidden_fields
+        self._panels = panels
+
+    ##
+    # hidden_field will retrieve an ASP.net hidden field sent with the response
+    #
+    # @param name The name of the field
+    #
+    # @return The raw value of the field or None
+
+    def hidden_field(self, name):
+        self._split()
+        return self._hidden_fields.get(name)
+
+    ##
+    # The url encoded view state, event validation and view state generator needed to post back from this response
+
+    @property
+    def view_state(self):
+        if self._view_state is None:
+            self._view_state = {'view'      : urllib.quote(self.hidden_field("__VIEWSTATE")),
+                                'validation': urllib.quote(self.hidden_field("__EVENTVALIDATION")),
+                                'generator' : urllib.quote(self.hidden_field("__VIEWSTATEGENERATOR"))}
+
+        return self._view_state
+
+    ##
+    # The markup of the update panels in the response, without the hidden fields
+
+    @property
+    def html(self):
+        if self._html is None:
+            self._split()
+            self._html = "".join(self._panels)
+
+        return self._html
+
+    ##
+    # The markup of the update panels with broken history tables repaired, see repair_history
+
+    @property
+    def repaired_html(self):
+        if self._repaired_html is None:
+            self._repaired_html = repair_history(self.html)
+
+        return self._repaired_html
+
+    ##
+    # The reported number of rows embedded in the response, or None if it isn't reported
+
+    @property
+    def record_count(self):
+        if self._record_count is None:
+            match = record_count_regex.search(self.html)
+            if match is not None:
+                self._record_count = int(match.group(1))
+
+        return self._record_count
+
+    ##
+    # result_table will retrieve the table of data from an async page response, parsing it once
+    #
+    # @return The bs4 object with table or None
+
+    def result_table(self):
+        if self._result_table is None:
+            self._result_table = get_result_table(self.html)
+
+        return self._result_table
+
+    ##
+    # details_div will retrieve the div containing data from an async detail response
+    #
+    # @return The bs4 object with div or None
+
+    def details_div(self):
+        return get_details_div(self.html)
+
+
+##
+# repair_history will fix the tables revocation date panels break in firm and individual history responses, in one
+# pass over the markup
+#
+# @param markup The response or panel markup
+#
+# @return The repaired markup
+
+def repair_history(markup):
+    with metrics.timed("parse.repair_history"):
+        return broken_history_regex.sub(_repair_match, markup)
+
+
+def _repair_match(match):
+    return match.group(1) if match.group(1) is not None else ""
+
+
+##
+# get_result_table will retrieve a table of data from the async page response markup
+#
+# @param markup The response or panel markup
+#
+# @return The bs4 object with table or None
+
+def get_result_table(markup):
+    match = result_table_regex.search(markup)
+
+    if match is None:
+        return None
+
+    return parse_html(match.group(0))
+
+
+##
+# get_details_div will retrieve a div containing data from the async detail response markup
+#
+# @param markup The response or panel markup
+#
+# @return The bs4 object with div or None
+
+def get_details_div(markup):
+    match = details_div_regex.search(markup)
+
+    if match is None:
+        return None
+
+    return parse_html(match.group(0))
+
+
+##
+# get_registrations_markup will cut the table of current registrations out of a firm or individual details response,
+# following nested tables to its own closing tag
+#
+# @param markup The response or panel markup
+#
+# @return The table's markup, or None if there's no such table
+
+def get_registrations_markup(markup):
+    start = registrations_regex.search(markup)
+    if start is None:
+        return None
+
+    depth = 0
+    for tag in table_tag_regex.finditer(markup, start.start()):
+        depth += -1 if tag.group(1) else 1
+        if depth == 0:
+            return markup[start.start():markup.index(">", tag.end()) + 1]
+
+    return None
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+import json
+import hashlib
+import sqlite3
+import metrics
+
+
+##
+# record_identity will give what a record is matched on between runs, the firm, jurisdiction and category of the
+# registration, and a hash of everything else in it bar the sample date, which changes on every run
+#
+# @param fields The record's decoded fields
+#
+# @return A tuple of the firm, jurisdiction, category and content hash
+
+def record_identity(fields):
+    content = dict(fields)
+    content.pop('sample_date', None)
+
+    return (fields.get('firm') or u"",
+            fields.get('jurisdiction') or u"",
+            fields.get('category') or u"",
+            hashlib.sha1(json.dumps(content, sort_keys=True)).hexdigest())
+
+
+##
+# Snapshot is an indexed copy of the records a run published, kept between runs in the data dir so the next run can
+# publish a change feed against it instead of the full dump. Records are keyed on firm + jurisdiction + category, the
+# few registrations sharing a key are told apart by the order the firm listed them in. A run's records are bulk loaded
+# into `current` in batches inside one transaction, diffed against `previous` with indexed joins streamed straight to
+# the feed, and only become `previous` once the feed has been written, so a run that dies in between publishes the
+# same feed again. Feed entries wrap records rather than being records, the licence transformer can't read them.
+
+class Snapshot(object):
+
+    columns = ("firm", "jurisdiction", "category", "occurrence", "hash", "record")
+
+    def __init__(self, path, batch_size=1000):
+        self.batch_size = batch_size
+
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+
+        for table in ("previous", "current"):
+            self.db.execute("CREATE TABLE IF NOT EXISTS %s("
+                            "firm TEXT NOT NULL, jurisdiction TEXT NOT NULL, category TEXT NOT NULL, "
+                            "occurrence INTEGER NOT NULL, hash TEXT NOT NULL, record TEXT NOT NULL, "
+                            "PRIMARY KEY (firm, jurisdiction, category, occurrence))" % table)
+        self.db.commit()
+
+    ##
+    # load will replace the current snapshot with a run's records
+    #
+    # @param records An iterable of json encoded records, e.g. read back from the records dump
+    #
+    # @return The number of records loaded
+
+    def load(self, records):
+        insert = "INSERT INTO current (%s) VALUES (?, ?, ?, ?, ?, ?)" % ", ".join(self.columns)
+        loaded = 0
+
+        with metrics.timed("db.snapshot.load"):
+            self.db.execute("DELETE FROM current")
+
+            batch = []
+            for row in self._rows(records):
+                batch.append(row)
+                if len(batch) >= self.batch_size:
+                    self.db.executemany(insert, batch)
+                    loaded += len(batch)
+                    batch = []
+
+            self.db.executemany(insert, batch)
+            loaded += len(batch)
+            self.db.commit()
+
+        return loaded
+
+    def _rows(self, records):
+        # a firm's records are contiguous, so only its own keys need counting
+        firm_name = None
+        occurrences = {}
+
+        for record in records:
+            firm, jurisdiction, category, content_hash = record_identity(json.loads(record))
+            if firm != firm_name:
+                firm_name = firm
+                occurrences = {}
+
+            occurrence = occurrences.get((jurisdiction, category), 0)
+            occurrences[(jurisdiction, category)] = occurrence + 1
+
+            if not isinstance(record, unicode):
+                record = record.decode("utf-8")
+
+            yield firm, jurisdiction, category, occurrence, content_hash, record
+
+    ##
+    # changes will diff the current snapshot against the previous one
+    #
+    # @return A generator of (change, record) tuples, change being "added", "modified" or "removed" and record the json
+    # encoded record, the one last published for removals
+
+    def changes(self):
+        added_or_modified = self.db.cursor().execute(
+            "SELECT current.record, previous.hash IS NOT NULL FROM current "
+            "LEFT JOIN previous ON previous.firm = current.firm AND previous.jurisdiction = current.jurisdiction "
+            "AND previous.category = current.category AND previous.occurrence = current.occurrence "
+            "WHERE previous.hash IS NULL OR previous.hash != current.hash")
+
+        for record, modified in added_or_modified:
+            yield "modified" if modified else "added", record
+
+        removed = self.db.cursor().execute(
+            "SELECT previous.record FROM previous "
+            "LEFT JOIN current ON current.firm = previous.firm AND current.jurisdiction = previous.jurisdiction "
+            "AND current.category = previous.category AND current.occurrence = previous.occurrence "
+            "WHERE current.firm IS NULL")
+
+        for record, in removed:
+            yield "removed", record
+
+    ##
+    # promote will make the current snapshot the one the next run is diffed against
+    #
+    # @return The number of records in it
+
+    def promote(self):
+        with metrics.timed("db.snapshot.promote"):
+            self.db.execute("DELETE FROM previous")
+            self.db.execute("INSERT INTO previous SELECT * FROM current")
+            self.db.execute("DELETE FROM current")
+            self.db.commit()
+
+        return self.db.execute("SELECT COUNT(*) FROM previous").fetchone()[0]
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+
+##
+# encode_change will serialise a change feed entry, splicing in the already encoded record
+#
+# @param change "added", "modified" or "removed"
+# @param record The json encoded record
+#
+# @return The json encoded entry
+
+def encode_change(change, record):
+    return '{"change": "%s", "record": %s}' % (change, record)
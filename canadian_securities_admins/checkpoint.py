@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import threading
+
+
+##
+# CheckpointJournal is an append-only log of crawl progress finer than the page counter turbotlib keeps. A firm entry
+# is written once the firm's records are safely in the dump, along with the dump's position at that point, so a resume
+# can cut the dump back to the last completed firm and carry on from the next one. Roster page entries are written as
+# the individuals stage finishes each page of a firm's roster, once the individuals it stored are committed, so a
+# resumed roster answers the pages it already walked from the individuals cache.
+
+class CheckpointJournal(object):
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.last_firm = None
+        self.roster_pages = {}
+
+        if os.path.exists(path):
+            with open(path, "r") as journal:
+                for line in journal:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # a torn final line from a crash mid-write, everything before it still counts
+                        break
+
+                    if 'firm' in entry:
+                        self.last_firm = entry
+                    elif 'roster' in entry:
+                        self.roster_pages[tuple(entry['roster'])] = entry['roster_page']
+
+        self.journal = open(path, "a")
+
+    def _append(self, entry):
+        with self.lock:
+            self.journal.write(json.dumps(entry) + "\n")
+            self.journal.flush()
+            os.fsync(self.journal.fileno())
+
+    ##
+    # firm_done will record a firm as emitted
+    #
+    # @param page_number The result page the firm is on
+    # @param firm_index The position of the firm on the page, starting at 0
+    # @param position The RecordWriter checkpoint taken once the firm's records were written
+
+    def firm_done(self, page_number, firm_index, position):
+        entry = {'page': page_number, 'firm': firm_index, 'position': position}
+        self._append(entry)
+        self.last_firm = entry
+
+    ##
+    # roster_page_done will record a page of a firm's individuals roster as stored
+    #
+    # @param firm_name The name of the firm
+    # @param position The position of the roster's location in the firm, starting at 1
+    # @param jurisdiction The jurisdiction of the roster
+    # @param roster_page The page of the roster, starting at 1
+
+    def roster_page_done(self, firm_name, position, jurisdiction, roster_page):
+        self._append({'roster': [firm_name, position, jurisdiction], 'roster_page': roster_page})
+
+    ##
+    # walked_roster_pages will give how far a firm's roster got before the run was interrupted. Rosters are told apart
+    # by their location's position in the firm, a firm's current and historical rosters can share a jurisdiction.
+    #
+    # @param firm_name The name of the firm
+    # @param position The position of the roster's location in the firm, starting at 1
+    # @param jurisdiction The jurisdiction of the roster
+    #
+    # @return The number of leading roster pages whose individuals are all stored
+
+    def walked_roster_pages(self, firm_name, position, jurisdiction):
+        return self.roster_pages.get((firm_name, position, jurisdiction), 0)
+
+    ##
+    # completed_firms will count the firms already emitted on a page
+    #
+    # @param page_number The result page
+    #
+    # @return The number of leading firms on the page to skip
+
+    def completed_firms(self, page_number):
+        if self.last_firm is None or self.last_firm['page'] != page_number:
+            return 0
+
+        return self.last_firm['firm'] + 1
+
+    ##
+    # last_page will give the result page of the last completed firm
+    #
+    # @return The page number or None if no firm has completed
+
+    def last_page(self):
+        if self.last_firm is None:
+            return None
+
+        return self.last_firm['page']
+
+    ##
+    # committed_position will give the dump position as of the last completed firm
+    #
+    # @return The RecordWriter checkpoint or None if no firm has completed
+
+    def committed_position(self):
+        if self.last_firm is None:
+            return None
+
+        return self.last_firm['position']
+
+    def close(self):
+        self.journal.close()
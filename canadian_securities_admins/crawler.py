@@ -0,0 +1,1351 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+import functools
+import os
+import sys
+import time
+import urllib
+import turbotlib
+import metrics
+from asp_response import AspResponse, get_details_div, get_registrations_markup, parse_html
+from change_feed import Snapshot, encode_change
+from checkpoint import CheckpointJournal
+from export import Export
+from firm_cache import FirmCache, firm_fingerprint
+from firm_model import Firm, Location, Individual, Category, normalise_contact, encode_individuals, encode_record
+from history_cache import HistoryCache, panel_digest
+from individuals_cache import IndividualsCache
+from record_writer import RecordWriter
+from record_output import RecordOutput
+from profiling import RunProfiler
+from rate_limit import RateLimiter
+from retry import RetryPolicy, CircuitBreaker, RequestFailed, FatalRequestError
+from shards import ShardRun, DatasetChanged, DATASET_CHANGED_EXIT, plan_shards, share_budgets, mark_done
+from transport import Transport, BodyTemplate
+from workers import WorkerPool, Coalescer
+
+
+DEFAULT_URL_START = "http://www.securities-administrators.ca/nrs/nrsearchResult.aspx?ID=1325"
+
+bot_directory = os.path.dirname(os.path.abspath(__file__))
+
+# Post body templates of page/detail requests, read the first time each is needed
+templates = {}
+
+
+##
+# load_template will give one of the post body templates shipped with the bot
+#
+# @param name The template's file name
+#
+# @return The BodyTemplate
+
+def load_template(name):
+    template = templates.get(name)
+    if template is None:
+        with open(os.path.join(bot_directory, name), "r") as raw:
+            template = templates[name] = BodyTemplate(raw.read())
+
+    return template
+
+
+##
+# Crawler is the scraper. Creating one only reads its configuration, from the environment by default (see the README);
+# nothing is created, opened, fetched or imported from the heavier dependencies until it's used. open() sets up the
+# caches, journal, record dumps and worker pools in the data dir, after which helpers like process_details or
+# get_firm_rows can be driven from a benchmark, a test harness or another process, and close() tears them down. The
+# crawler is also a context manager doing both. run() opens, crawls the whole form with crawl() and closes.
+
+class Crawler(object):
+
+    def __init__(self, environ=None):
+        environ = environ if environ is not None else os.environ
+
+        self.firm_workers = int(environ.get("CSA_FIRM_WORKERS", 4))
+        self.individual_workers = int(environ.get("CSA_INDIVIDUAL_WORKERS", 8))
+        self.retry_policy = RetryPolicy(max_attempts=int(environ.get("CSA_MAX_ATTEMPTS", 6)),
+                                        base_delay=float(environ.get("CSA_RETRY_BASE_DELAY", 1.0)),
+                                        max_delay=float(environ.get("CSA_RETRY_MAX_DELAY", 60.0)))
+        self.request_timeout = (float(environ.get("CSA_CONNECT_TIMEOUT", 10.0)),
+                                float(environ.get("CSA_READ_TIMEOUT", 60.0)))
+        self.circuit_breaker = CircuitBreaker(failure_threshold=int(environ.get("CSA_BREAKER_THRESHOLD", 10)),
+                                              reset_timeout=float(environ.get("CSA_BREAKER_RESET", 30.0)))
+        self.rate_limiter = RateLimiter({'page'      : float(environ.get("CSA_RATE_PAGE", 1.0)),
+                                         'detail'    : float(environ.get("CSA_RATE_DETAIL", 5.0)),
+                                         'individual': float(environ.get("CSA_RATE_INDIVIDUAL", 5.0))},
+                                        burst=int(environ.get("CSA_RATE_BURST", 5)),
+                                        adaptive=environ.get("CSA_RATE_ADAPTIVE", "1") == "1",
+                                        latency_target=float(environ.get("CSA_RATE_LATENCY_TARGET", 5.0)))
+        self.keep_individuals = environ.get("CSA_KEEP_INDIVIDUALS", "0") == "1"
+        self.individuals_ttl = float(environ.get("CSA_INDIVIDUALS_TTL_DAYS", 30)) * 86400
+        self.incremental = environ.get("CSA_INCREMENTAL", "0") == "1"
+        self.firm_refresh_age = float(environ.get("CSA_FIRM_REFRESH_DAYS", 90)) * 86400
+        self.cache_history = environ.get("CSA_HISTORY_CACHE", "0") == "1"
+        self.history_max_age = float(environ.get("CSA_HISTORY_TTL_DAYS", 30)) * 86400
+        self.record_compression = environ.get("CSA_RECORD_COMPRESSION") or None
+        self.record_rotate_bytes = int(float(environ.get("CSA_RECORD_ROTATE_MB", 0)) * 1024 * 1024)
+        self.licence_output = environ.get("CSA_LICENCE_OUTPUT") or None
+        self.change_feed = environ.get("CSA_CHANGE_FEED") or None
+        self.export_formats = [name for name in environ.get("CSA_EXPORT", "").split(",") if name]
+        self.metrics_interval = float(environ.get("CSA_METRICS_INTERVAL", 60))
+        self.profiler_kind = environ.get("CSA_PROFILE") or None
+        self.shard_count = int(environ.get("CSA_SHARDS", 1))
+        self.page_size = int(environ.get("CSA_PAGE_SIZE", 100))
+        self.record_fixtures = environ.get("CSA_RECORD_FIXTURES") or None
+        self.url_start = environ.get("CSA_URL_START", DEFAULT_URL_START)
+
+        # set by the coordinator on each of its shard workers
+        self.shard_pages = environ.get("CSA_SHARD_PAGES") or None
+        self.shard_record_count = int(environ.get("CSA_SHARD_RECORD_COUNT", 0))
+        self.shard_rows_per_page = int(environ.get("CSA_SHARD_ROWS_PER_PAGE", 100))
+        self.data_dir = environ.get("CSA_SHARD_DIR") or None
+
+        self.individual_fetches = Coalescer()
+        self._transport = None
+
+        # opened by open()
+        self.profiler = None
+        self.metrics_reporter = None
+        self.individuals_cache = None
+        self.firm_cache = None
+        self.history_cache = None
+        self.journal = None
+        self.record_writer = None
+        self.licence_writer = None
+        self.record_output = None
+        self.snapshot = None
+        self.change_writer = None
+        self.export = None
+        self.firm_pool = None
+        self.individual_pool = None
+
+    ##
+    # The request transport with a connection per worker, created on first use. With CSA_RECORD_FIXTURES set it records
+    # everything it sends as replay fixtures.
+
+    @property
+    def transport(self):
+        if self._transport is None:
+            transport = Transport(self.firm_workers + self.individual_workers + 1, self.request_timeout)
+            if self.record_fixtures is not None:
+                from replay import record_session
+                record_session(transport.session, self.record_fixtures, pool_connections=1,
+                               pool_maxsize=transport.pool_size)
+
+            self._transport = transport
+
+        return self._transport
+
+    ##
+    # retrieve will attempt to return a completed request, retrying transient failures. Retries back off with
+    # decorrelated jitter (honouring Retry-After) and every worker shares one circuit breaker, so a struggling host gets
+    # a break from the whole crawl rather than from one thread at a time. Every attempt spends a token from the rate
+    # limiter budget of its kind of request.
+    #
+    # @param url The web address
+    # @param method The HTTP method
+    # @param data The payload
+    # @param kind The rate limiter budget to draw from: page, detail or individual
+    #
+    # @return The response data (including headers), raising RequestFailed on failure
+
+    def retrieve(self, url, method, data, kind="detail"):
+        delay = self.retry_policy.base_delay
+        response = None
+
+        for attempt in range(1, self.retry_policy.max_attempts + 1):
+            waited = self.circuit_breaker.wait_until_closed()
+            if waited > 0:
+                metrics.increment("requests.breaker_wait_seconds", waited)
+                metrics.observe("request.breaker_wait", waited)
+
+            throttled = self.rate_limiter.acquire(kind)
+            if throttled > 0:
+                metrics.increment("requests.throttle_wait_seconds", throttled)
+                metrics.observe("request.throttle_wait", throttled)
+
+            response = None
+            metrics.increment("requests")
+            metrics.increment("requests." + kind)
+            started = time.time()
+
+            try:
+                response = self.transport.send(method, url, data)
+
+            except self.transport.errors as e:
+                if not self.retry_policy.is_retryable_error(e):
+                    metrics.increment("requests.fatal")
+                    raise FatalRequestError("Request to %s failed: %s" % (url, e))
+
+                turbotlib.log("There was a failure reaching the host: " + str(e))
+
+            latency = time.time() - started
+            metrics.observe("request.network." + kind, latency)
+
+            success = response is not None and response.status_code == self.transport.ok
+            new_rate = self.rate_limiter.record(kind, latency, success)
+            if new_rate is not None:
+                turbotlib.log("Adjusted %s request rate to %.2f/s" % (kind, new_rate))
+
+            if response is not None:
+                if success:
+                    self.circuit_breaker.record_success()
+                    metrics.increment("requests.bytes_received", int(response.headers.get("Content-Length", 0)))
+                    return response
+
+                if not self.retry_policy.is_retryable_status(response.status_code):
+                    metrics.increment("requests.fatal")
+                    raise FatalRequestError("Request to %s failed with status %d" % (url, response.status_code),
+                                            response)
+
+                turbotlib.log("There was a failure understanding the host, status %d" % response.status_code)
+                if response.text is not None:
+                    turbotlib.log("Failure was: " + response.text)
+
+            metrics.increment("requests.failures")
+            if self.circuit_breaker.record_failure():
+                metrics.increment("requests.breaker_opened")
+                turbotlib.log("Too many consecutive failures, pausing all requests for %d seconds"
+                              % self.circuit_breaker.reset_timeout)
+
+            if attempt < self.retry_policy.max_attempts:
+                delay = self.retry_policy.next_delay(delay, response)
+                metrics.increment("requests.retries")
+                turbotlib.log("Waiting %.1f seconds and retrying (attempt %d)..." % (delay, attempt + 1))
+                with metrics.timed("request.retry_sleep"):
+                    time.sleep(delay)
+
+        metrics.increment("requests.exhausted")
+        raise RequestFailed("Request to %s failed after %d attempts" % (url, self.retry_policy.max_attempts), response)
+
+
+    ##
+    # retrieve_async will perform an async postback and parse the MicrosoftAjax delta it returns
+    #
+    # @param url The web address
+    # @param data The payload
+    # @param kind The rate limiter budget to draw from: page, detail or individual
+    #
+    # @return The AspResponse
+
+    def retrieve_async(self, url, data, kind="detail"):
+        return AspResponse(self.retrieve(url, "POST", data, kind).text)
+
+
+    ##
+    # generate_body will build the body payload for a page request, asking for CSA_PAGE_SIZE rows per page
+    #
+    # @param page_number The current page
+    # @param view_state The view state of the previous page
+    #
+    # @return A data string
+
+    def generate_body(self, page_number, view_state):
+        body = load_template("post_body_seed.raw" if page_number == 1 else "post_body_continue.raw")
+        return body.render({'PAGE_NUMBER': str(page_number),
+                            'PAGE_SIZE'  : str(self.page_size),
+                            'VIEW_STATE' : view_state['view'],
+                            'VALIDATION' : view_state['validation'],
+                            'GENERATOR'  : view_state['generator']})
+
+
+    ##
+    # generate_body_detail will build the body payload for a detail request
+    #
+    # @param control_id The id of the control we're sending as the event target
+    # @param view_state The current ASP.NET viewstate
+    #
+    # @return A data string
+
+    def generate_body_control(self, control_id, view_state):
+        return load_template("post_body_control.raw").render({'CONTROL_ID': control_id,
+                                                              'PAGE_SIZE' : str(self.page_size),
+                                                              'VIEW_STATE': view_state['view'],
+                                                              'VALIDATION': view_state['validation'],
+                                                              'GENERATOR' : view_state['generator']})
+
+
+    ##
+    # Retrieve the company roster (historical inclusive) for a firm, stores in cache
+    #
+    # @param href The href of the link containing the individual's postback
+    # @param url The seed url
+    # @param individuals_view_state The previous viewstate to work off of
+    # @param name The individual's name
+    # @param firm_name The name of the firm whose roster listed the individual
+
+    def get_and_store_individuals_for_firm(self, href, url, individuals_view_state, name, firm_name):
+        control_id = urllib.quote(href.replace("javascript:__doPostBack('", '').replace("','')", ''))
+        details_body = self.generate_body_control(control_id, individuals_view_state)
+        individual_details_req = self.retrieve_async(url, details_body, "individual")
+
+        history_req = None
+        history_rows = None
+        history_entries = []
+
+        if "ctl00_bodyContent_lbtnShowIndHistorical" in individual_details_req.html:
+            history_key = u"individual\0%s\0%s" % (name, firm_name)
+            digest = panel_digest(get_registrations_markup(individual_details_req.html) or individual_details_req.html)
+            if self.history_cache is not None:
+                history_rows = self.history_cache.get(history_key, digest)
+
+            if history_rows is None:
+                individuals_history_view_state = individual_details_req.view_state
+
+                history_body = self.generate_body_control("ctl00%24bodyContent%24lbtnShowIndHistorical",
+                                                          individuals_history_view_state)
+                history_req = self.retrieve_async(url, history_body, "individual")
+
+        resp_markup = individual_details_req.details_div()
+        locations_entries = resp_markup.select("#ctl00_bodyContent_dlstIndLocations > tr > td")
+
+        if history_req is not None:
+
+            # Fix super broken tables on history responses
+            history_markup = get_details_div(history_req.repaired_html)
+            if history_markup is not None:
+                history_entries = history_markup.select("#ctl00_bodyContent_dlstIndLocations > tr > td")
+
+        rows = []
+        for entry in (locations_entries + history_entries):
+            individual = Individual(name, entry.select('.sectiontitle > span')[0].text.strip())
+
+            locations_table = entry.select('tbody')
+            locations_rows = locations_table[0].find_all("tr", recursive=False)
+
+            for row in locations_rows:
+                field = row.select('th > span') or row.select('th')
+                if len(field) > 0:
+                    field = field[0].text.strip()
+
+                    if field == "Firm":
+                        individual.firm = row.find('td').text.strip()
+
+                    elif field == "Category":
+                        individual.categories.append(Category(row.find('td').text.strip()))
+
+                    elif field == "From":
+                        individual.categories[-1].from_date = row.find('td').text.strip()
+
+                    elif field == "To":
+                        individual.categories[-1].to = row.find('td').text.strip()
+
+                    elif field == "Status":
+                        individual.categories[-1].status = row.find('td').text.strip()
+
+                    elif field == "Terms & Conditions":
+                        individual.terms = row.select('td > span')[0].text.strip()
+
+                    elif field == "Contact Information":
+                        individual.contact = normalise_contact(row.select('td table td'))
+
+            rows.append(individual.row())
+
+        # history rows come after the current ones, one per entry
+        if history_rows is not None:
+            rows.extend([tuple(row) for row in history_rows])
+        elif history_req is not None and self.history_cache is not None:
+            self.history_cache.store(history_key, digest, rows[len(locations_entries):])
+
+        self.individuals_cache.store(rows, (name, firm_name))
+
+
+    ##
+    # lookup_individual will serve an individual from the cache, fetching and storing their details on a miss.
+    # Runs on the individuals worker pool. A person's details page lists every jurisdiction and firm they're registered
+    # with, so it's fetched at most once per (name, firm): later lookups under the firm's other jurisdictions or its
+    # historical entries are answered from what that fetch stored, and concurrent lookups share the one fetch.
+    #
+    # @param url The url of the form to process
+    # @param href The href of the individual's details link
+    # @param view_state The view state of the roster page the individual was listed on
+    # @param name The individual's name
+    # @param firm_jurisdiction The jurisdiction of the individual's firm
+    # @param firm_name The name of the individual's firm
+    # @param walked True if the individual is on a roster page a previous attempt at the run already stored, answered
+    # from the cache alone
+    #
+    # @return True if the individual was found
+
+    @metrics.instrument("individuals.lookup")
+    def lookup_individual(self, url, href, view_state, name, firm_jurisdiction, firm_name, walked=False):
+        if self.individuals_cache.get(name, firm_jurisdiction, firm_name) is not None:
+            return True
+
+        if walked:
+            metrics.increment("individuals.resumed")
+            return False
+
+        if self.individuals_cache.person_fetched(name, firm_name):
+            metrics.increment("individuals.deduplicated")
+            return False
+
+        _, shared = self.individual_fetches.run((name, firm_name), self.fetch_person, href, url, view_state, name,
+                                                firm_name)
+        if shared:
+            metrics.increment("individuals.coalesced")
+
+        return self.individuals_cache.get(name, firm_jurisdiction, firm_name) is not None
+
+
+    ##
+    # fetch_person will fetch an individual's details unless a fetch that finished between lookup_individual's check and
+    # this one joining the coalescer already stored them
+    #
+    # @param href The href of the individual's details link
+    # @param url The url of the form to process
+    # @param view_state The view state of the roster page the individual was listed on
+    # @param name The individual's name
+    # @param firm_name The name of the individual's firm
+
+    def fetch_person(self, href, url, view_state, name, firm_name):
+        if self.individuals_cache.person_fetched(name, firm_name):
+            metrics.increment("individuals.deduplicated")
+            return
+
+        self.get_and_store_individuals_for_firm(href, url, view_state, name, firm_name)
+
+
+    ##
+    # collect_individuals will wait for a firm's roster stage to drain and merge its results. As each roster page drains
+    # the individuals stored for it are committed and the page is checkpointed.
+    #
+    # @param roster_job The job returned when the roster was queued on the individuals worker pool
+    # @param firm_name The name of the firm
+    # @param position The position of the roster's location in the firm, starting at 1
+    # @param jurisdiction The jurisdiction of the roster
+    #
+    # @return A list of the names of the individuals found
+
+    def collect_individuals(self, roster_job, firm_name, position, jurisdiction):
+        return_array = []
+        listed = 0
+
+        for roster_page, lookup_jobs in enumerate(roster_job.result(), 1):
+            for name, lookup_job in lookup_jobs:
+                listed += 1
+                if lookup_job.result():
+                    return_array.append(name)
+
+            self.individuals_cache.commit()
+            self.journal.roster_page_done(firm_name, position, jurisdiction, roster_page)
+
+        self.firm_cache.store_roster_size(firm_name, jurisdiction, listed)
+        return return_array
+
+
+    ##
+    # estimate_roster_cost will guess how many requests walking a roster takes: the roster page itself plus the details
+    # of every listed individual not already fetched from the firm's rosters
+    #
+    # @param firm_name The name of the firm
+    # @param roster_size The number of individuals on the roster
+    #
+    # @return The estimated number of requests
+
+    def estimate_roster_cost(self, firm_name, roster_size):
+        if roster_size == 0:
+            return 1
+
+        return 1 + max(0, roster_size - self.individuals_cache.count_persons(firm_name))
+
+
+    ##
+    # estimate_firm_cost will guess how many requests a firm takes from the size of its largest roster the last time it
+    # was walked, so the firm worker pool can start the most expensive firms on a page first
+    #
+    # @param firm_name The name of the firm
+    #
+    # @return The estimated number of requests
+
+    def estimate_firm_cost(self, firm_name):
+        return 2 + self.estimate_roster_cost(firm_name, self.firm_cache.roster_size(firm_name))
+
+
+    ##
+    # get_registered_individuals will walk the roster of all individuals belonging to a firm, queueing a lookup of each
+    # individual's current/historical license data on the individuals worker pool. Runs on the individuals worker pool
+    # itself, but never waits on the lookups it queues so the pool can't deadlock. Lookups are queued with the roster's
+    # estimated cost as their priority, so the individuals of the biggest rosters are fetched first.
+    #
+    # @param url The url of the form to process
+    # @param control_href The details link href
+    # @param view_state The previous view state to work off of
+    # @param firm_jurisdiction The jurisdiction of the individual's firm
+    # @param firm_name The name of the invdividual's firm
+    # @param position The position of the roster's location in the firm, starting at 1
+    #
+    # @return A list of roster pages, each a list of (name, job) tuples with the job resolving to True if found
+
+    @metrics.instrument("individuals.roster")
+    def get_registered_individuals(self, url, control_href, view_state, firm_jurisdiction, firm_name, position):
+        return_array = []
+        turbotlib.log("Retrieving individuals for current or historical firm: " + firm_name + " in: " +
+                      firm_jurisdiction)
+
+        control_id = urllib.quote(control_href.replace("javascript:__doPostBack('", '').replace("','')", ''))
+        individuals_page_req = self.retrieve_async(url, self.generate_body_control(control_id, view_state),
+                                                   "individual")
+
+        if "Your search returned no records, please try searching again" in individuals_page_req.html:
+            return []
+
+        num_individuals = individuals_page_req.record_count
+        priority = self.estimate_roster_cost(firm_name, num_individuals or 0)
+
+        # pages journalled before an interruption are still walked for their view state, but not fetched again
+        walked_pages = self.journal.walked_roster_pages(firm_name, position, firm_jurisdiction)
+        processed_individuals = 0
+        last_processed_individuals = 0
+        ind_page = 1
+
+        while True:
+            individuals_view_state = individuals_page_req.view_state
+
+            page_jobs = []
+            return_array.append(page_jobs)
+
+            individual_links = parse_html(individuals_page_req.html).select('tr > td > a')
+            for link in individual_links:
+                try:
+                    if "lbtnIndDetail" not in link['href']:
+                        continue
+                except:
+                    continue
+
+                processed_individuals += 1
+
+                name = link.text.strip()
+                job = self.individual_pool.submit_with_priority(priority, self.lookup_individual, url, link['href'],
+                                                                dict(individuals_view_state), name, firm_jurisdiction,
+                                                                firm_name, ind_page <= walked_pages)
+                page_jobs.append((name, job))
+
+            if processed_individuals < num_individuals:
+                if last_processed_individuals == processed_individuals:
+                    turbotlib.log('Warning: broke out of possible infinite loop trying to retrieve all individuals '
+                                  'for firm.')
+                    break
+
+                ind_page += 1
+                control_id = urllib.quote('ctl00$bodyContent$lbtnPager{0}'.format(ind_page))
+                page_body = self.generate_body_control(control_id, individuals_view_state)
+                individuals_page_req = self.retrieve_async(url, page_body, "individual")
+
+                last_processed_individuals = processed_individuals
+            else:
+                break
+
+        return return_array
+
+
+    ##
+    # process_details will perform the href action on a firm link to retrieve its details.
+    #
+    # @param url The url of the form to process
+    # @param control_href The details link href
+    # @param firm_name The name of the firm
+    # @param view_state The view state of the result page the firm was listed on, owned by the calling worker
+    #
+    # @return A Firm with its locations and associated data
+
+    @metrics.instrument("firm.details")
+    def process_details(self, url, control_href, firm_name, view_state):
+        firm = Firm(firm_name)
+
+        control_id = urllib.quote(control_href.replace("javascript:__doPostBack('", '').replace("','')", ''))
+        details_req = self.retrieve_async(url, self.generate_body_control(control_id, view_state), "detail")
+        detail_view_state = details_req.view_state
+
+        history_req = None
+        cached_history = None
+        history_entries = []
+
+        if "ctl00_bodyContent_lbtnShowFirmHistorical" in details_req.html:
+            history_key = u"firm\0" + firm_name
+            digest = panel_digest(get_registrations_markup(details_req.html) or details_req.html)
+            if self.history_cache is not None:
+                cached_history = self.history_cache.get(history_key, digest)
+
+            if cached_history is None:
+                history_body = self.generate_body_control("ctl00%24bodyContent%24lbtnShowFirmHistorical",
+                                                          detail_view_state)
+                history_req = self.retrieve_async(url, history_body, "detail")
+
+        resp_markup = details_req.details_div()
+        locations_entries = resp_markup.select("#ctl00_bodyContent_dlstFirmLocations > tr > td")
+
+        if history_req is not None:
+
+            # Fix super broken tables on history resp
+            history_markup = get_details_div(history_req.repaired_html)
+            history_entries = history_markup.select("#ctl00_bodyContent_dlstFirmLocations > tr > td")
+
+            # Store history view state
+            history_view_state = history_req.view_state
+
+            # Check for previous names of the company
+            old_names = history_markup.select('#ctl00_bodyContent_pnlFirmOtherNames td')
+            for name_row in old_names:
+                if "Previous Name:" not in name_row.text:
+                    firm.historical_names.append(name_row.text.strip())
+
+        entries = [(entry, detail_view_state) for entry in locations_entries]
+        if history_req is not None:
+            entries.extend([(entry, history_view_state) for entry in history_entries])
+
+        for entry, referring_view_state in entries:
+            location = Location(entry.select('.sectiontitle > span')[0].text.strip())
+            locations_table = entry.find('table', recursive=False).find('tbody', recursive=False)
+            locations_rows = locations_table.find_all("tr", recursive=False)
+
+            for row in locations_rows:
+
+                # retrieve registered and permitted individuals
+                potential_permitted_links = row.select('span > a')
+                if len(potential_permitted_links) > 0:
+                    for link in potential_permitted_links:
+                        if "Registered and Permitted Individuals" in link.text:
+                            # queue the roster on the individuals stage, collect_individuals merges it once drained
+                            roster_size = self.firm_cache.roster_size(firm_name, location.jurisdiction)
+                            roster_cost = self.estimate_roster_cost(firm_name, roster_size)
+                            location.individuals = self.individual_pool.submit_with_priority(
+                                roster_cost, self.get_registered_individuals, url, link['href'], referring_view_state,
+                                location.jurisdiction, firm_name, len(firm.locations) + 1)
+                            break
+
+
+                # retrieve key value style data
+                field = row.select('th > span') or row.select('th')
+                if len(field) > 0:
+                    field = field[0].text.strip()
+
+                    if field == "Category":
+                        location.categories.append(Category(row.find('td').text.strip()))
+
+                    elif field == "From":
+                        location.categories[-1].from_date = row.find('td').text.strip()
+
+                    elif field == "To":
+                        location.categories[-1].to = row.find('td').text.strip()
+
+                    elif field == "Status":
+                        location.categories[-1].status = row.find('td').text.strip()
+
+                    elif field == "Terms & Conditions":
+                        location.terms = row.select('td > span')[0].text.strip()
+
+                    elif field == "Contact Information":
+                        location.contact = normalise_contact(row.select('td table td'))
+
+            firm.locations.append(location)
+
+        if cached_history is not None:
+            firm.historical_names = cached_history['historical_names']
+            firm.locations.extend([Location.from_fields(fields) for fields in cached_history['locations']])
+
+        elif history_req is not None and self.history_cache is not None:
+            history_locations = firm.locations[len(locations_entries):]
+
+            # historical rosters are posted back from the history view state, so those histories are fetched every time
+            if all([location.individuals is None for location in history_locations]):
+                history = {'historical_names': firm.historical_names,
+                           'locations': [location.encode() for location in history_locations]}
+                self.history_cache.store(history_key, digest, history)
+
+        return firm
+
+
+    ##
+    # encode_location_individuals will wait for a location's roster to drain and stream its individuals out of the cache
+    # into a json array
+    #
+    # @param firm_name The name of the firm
+    # @param position The position of the location in the firm, starting at 1
+    # @param location The Location with a queued roster
+    #
+    # @return The json array
+
+    def encode_location_individuals(self, firm_name, position, location):
+        names = self.collect_individuals(location.individuals, firm_name, position, location.jurisdiction)
+        return encode_individuals(self.individuals_cache.iter_individuals(names, location.jurisdiction, firm_name))
+
+
+    ##
+    # get_firm_rows will find the firms listed on a result page
+    #
+    # @param response The AspResponse of the page
+    #
+    # @return A list of the firm and jurisdictions cells of each row, or None if the page has no result table
+
+    def get_firm_rows(self, response):
+        table = response.result_table()
+        if table is None:
+            return None
+
+        rows = []
+        for tr in table.find_all('tr'):
+            tds = tr.find_all('td')
+            if len(tds) == 2:
+                rows.append(tds)
+
+        return rows
+
+
+    ##
+    # seek_page will jump straight to a result page from the seed view state by posting that page's pager event, rather
+    # than walking every page before it. The page is checked against the rows it should hold, a full page unless it's
+    # the last, and against the seed's own rows in case the server ignored the jump and echoed them back. A page that
+    # fails the check is reached by walking the pager chain instead.
+    #
+    # @param url The url of the form to process
+    # @param page_number The page to seek to
+    # @param seed The response to the seed request
+    # @param rows_per_page The number of rows on a result page
+    #
+    # @return The page's response
+
+    def seek_page(self, url, page_number, seed, rows_per_page):
+        # Strange behavior on server: first call returns page 1 results but page must be > 1 to not get null resp
+        response = self.retrieve_async(url, self.generate_body(2 if page_number == 1 else page_number, seed.view_state),
+                                       "page")
+        if page_number == 1 or self.is_page(response, page_number, seed, rows_per_page):
+            metrics.increment("pages.seek")
+            return response
+
+        turbotlib.log("Could not seek to page %d, walking the pager instead" % page_number)
+        metrics.increment("pages.seek_walk")
+
+        response = seed
+        for pager in [2] + range(2, page_number + 1):
+            response = self.retrieve_async(url, self.generate_body(pager, response.view_state), "page")
+
+        return response
+
+
+    ##
+    # is_page will check a response holds the rows expected of a result page
+    #
+    # @param response The AspResponse of the page
+    # @param page_number The page it should be
+    # @param seed The response to the seed request
+    # @param rows_per_page The number of rows on a result page
+    #
+    # @return True if the rows fit the page
+
+    def is_page(self, response, page_number, seed, rows_per_page):
+        rows = self.get_firm_rows(response)
+        record_count = response.record_count
+        if rows is None or record_count is None:
+            return False
+
+        if len(rows) != min(rows_per_page, record_count - (page_number - 1) * rows_per_page):
+            return False
+
+        seed_rows = self.get_firm_rows(seed)
+        return not seed_rows or rows[0][0].text.strip() != seed_rows[0][0].text.strip()
+
+
+    ##
+    # detect_rows_per_page will find how many rows the server puts on a result page. Asking for a bigger page than the
+    # server allows gets its maximum back, so a first page holding fewer rows than the record count gives the real size.
+    #
+    # @param url The url of the form to process
+    # @param seed The response to the seed request
+    #
+    # @return A tuple of the number of rows per page and the first page's response
+
+    def detect_rows_per_page(self, url, seed):
+        response = self.seek_page(url, 1, seed, self.page_size)
+        rows = self.get_firm_rows(response) or []
+        record_count = response.record_count or 0
+
+        if 0 < len(rows) < record_count:
+            if len(rows) != self.page_size:
+                turbotlib.log("The server pages %d rows at a time" % len(rows))
+
+            return len(rows), response
+
+        return self.page_size, response
+
+
+    ##
+    # process_page will perform a retrieval on a specific page and format the output, see queue_page and write_page
+    #
+    # @param url The url of the form to process
+    # @param page_number The page to request
+    # @param view_state The view state of the previous page
+    # @param discard_data Determine if we throw away the data or process it
+    # @param checkpoint_page The page number firms are checkpointed against
+    # @param skip_firms The number of leading firms on the page already emitted by an earlier run
+    # @param response The page's response if it has already been retrieved, e.g. by seek_page
+    #
+    # @return A tuple of the parsed response and its view state
+
+    def process_page(self, url, page_number, view_state, discard_data=False, checkpoint_page=None, skip_firms=0,
+                     response=None):
+        if discard_data:
+            req = response or self.retrieve_async(url, self.generate_body(page_number, view_state), "page")
+            return req, req.view_state
+
+        req, page_view_state, firms = self.queue_page(url, page_number, view_state, skip_firms, response)
+        self.write_page(firms, checkpoint_page)
+        return req, page_view_state
+
+
+    ##
+    # queue_page will retrieve a result page and start fetching its firms. Firm details are fetched concurrently on the
+    # firm worker pool, each worker posting back with its own copy of the page's view state. In incremental mode firms
+    # whose listing is unchanged since the last run re-emit their cached records instead of being fetched. Firms are
+    # started most expensive first, judged by their rosters last time, and the crawl queues the next page before
+    # writing this one, so a big dealer isn't left running alone at the end of a page.
+    #
+    # @param url The url of the form to process
+    # @param page_number The page to request
+    # @param view_state The view state of the previous page
+    # @param skip_firms The number of leading firms on the page already emitted by an earlier run
+    # @param response The page's response if it has already been retrieved, e.g. by seek_page
+    #
+    # @return A tuple of the parsed response, its view state and the page's queued firms, see write_page
+
+    def queue_page(self, url, page_number, view_state, skip_firms=0, response=None):
+        if response is not None:
+            req = response
+        else:
+            req = self.retrieve_async(url, self.generate_body(page_number, view_state), "page")
+        page_view_state = req.view_state
+
+        rows = self.get_firm_rows(req)
+        if rows is None:
+            raise Exception("Result page %d has no result table" % page_number)
+
+        firms = []
+        for firm_index, tds in enumerate(rows):
+            if firm_index < skip_firms:
+                continue
+
+            a = tds[0].find('a')
+            firm_name = tds[0].text.strip()
+            all_jurisdictions = tds[1].text.strip()
+            fingerprint = firm_fingerprint(firm_name, all_jurisdictions)
+
+            cached = self.firm_cache.get(fingerprint, datetime.datetime.now().isoformat()) if self.incremental else None
+            if cached is not None:
+                firms.append((firm_index, firm_name, all_jurisdictions, fingerprint, None, cached))
+            else:
+                job = self.firm_pool.submit_with_priority(self.estimate_firm_cost(firm_name), self.process_details, url,
+                                                          a['href'], firm_name, dict(page_view_state))
+                firms.append((firm_index, firm_name, all_jurisdictions, fingerprint, job, None))
+
+        return req, page_view_state, firms
+
+
+    ##
+    # write_page will emit the records of a page's queued firms in page order as each firm and its individuals stage
+    # drain. Each firm is checkpointed as soon as its records are written.
+    #
+    # @param firms The queued firms returned by queue_page
+    # @param checkpoint_page The page number firms are checkpointed against
+
+    def write_page(self, firms, checkpoint_page):
+        for firm_index, firm_name, all_jurisdictions, fingerprint, job, cached in firms:
+            if cached is not None:
+                metrics.increment("firms.unchanged")
+                for record in cached:
+                    self.record_output.write(record)
+            else:
+                metrics.increment("firms.fetched")
+                firm = job.result()
+                firm.all_jurisdictions = all_jurisdictions
+                firm.sample_date = datetime.datetime.now().isoformat()
+                firm.source_url = self.url_start
+
+                encoded_records = []
+                for fields, individuals in firm.flatten(functools.partial(self.encode_location_individuals, firm_name)):
+                    record = encode_record(fields, individuals)
+                    self.record_output.write(record, fields)
+                    encoded_records.append(record)
+
+                self.firm_cache.store(fingerprint, firm_name, firm.sample_date, encoded_records)
+
+            self.journal.firm_done(checkpoint_page, firm_index, self.record_output.checkpoint())
+            metrics.increment("firms.done")
+
+        self.firm_cache.commit()
+        if self.history_cache is not None:
+            self.history_cache.commit()
+
+
+    ##
+    # reset_state will erase and in-progress databases / record files and reset the internal page counter to zero.
+    # The individuals cache survives when CSA_KEEP_INDIVIDUALS is set, its rows expire by age instead.
+
+    def reset_state(self):
+        turbotlib.save_var("page", 1)
+        turbotlib.save_var("check_count", None)
+        turbotlib.save_var("rows_per_page", None)
+        turbotlib.save_var("page_size", None)
+
+        self.record_output.remove()
+
+        try:
+            os.remove('%s/checkpoint.journal' % self.data_dir)
+        except:
+            pass
+
+        if self.keep_individuals:
+            self.individuals_cache.commit()
+            return
+
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.remove('%s/individuals.db%s' % (self.data_dir, suffix))
+            except:
+                pass
+
+
+    ##
+    # process_pages will iterate over the pages in the form, stopping when we've processed all rows or when the
+    # application state is invalid.
+    #
+    # @param url The url of the form to process
+    # @param seed The response to the seed request, paging starts by seeking from it
+
+    def process_pages(self, url, seed):
+
+        # Attempt to resume if we can
+        try:
+            page_number = turbotlib.get_var("page")
+            record_count = turbotlib.get_var("check_count")
+        except KeyError:
+            page_number = 1
+            record_count = None
+
+        # page numbers only hold for the page size they were counted in, so a resume keeps it
+        try:
+            rows_per_page = turbotlib.get_var("rows_per_page")
+        except KeyError:
+            rows_per_page = 100 if page_number > 1 else None
+
+        try:
+            counted_page_size = turbotlib.get_var("page_size")
+        except KeyError:
+            counted_page_size = None
+
+        committed_position = self.journal.committed_position()
+
+        # unless CSA_PAGE_SIZE changed since, then the resume carries on from the same firm counted in the new size
+        completed = None
+        if rows_per_page is not None and counted_page_size not in (None, self.page_size):
+            turbotlib.log("CSA_PAGE_SIZE changed from %d to %d, recounting the pages to resume from" %
+                          (counted_page_size, self.page_size))
+            completed = (page_number - 1) * rows_per_page + self.journal.completed_firms(page_number)
+            rows_per_page = None
+
+        seeked = None
+        if rows_per_page is None:
+            rows_per_page, seeked = self.detect_rows_per_page(url, seed)
+            turbotlib.save_var("rows_per_page", rows_per_page)
+
+        if completed is not None:
+            page_number = completed // rows_per_page + 1
+            turbotlib.save_var("page", page_number)
+
+            # the last completed firm is journalled again under its page and position in the new size
+            if committed_position is not None and completed > 0:
+                self.journal.firm_done((completed - 1) // rows_per_page + 1, (completed - 1) % rows_per_page,
+                                       committed_position)
+
+        turbotlib.save_var("page_size", self.page_size)
+
+        if page_number != 1:
+            seeked = None
+
+        skip_firms = 0
+
+        if committed_position is not None:
+            skip_firms = self.journal.completed_firms(page_number)
+            turbotlib.log("Resuming run from page {0}, firm {1}".format(page_number, skip_firms + 1))
+            metrics.set_gauge("firms.resumed", (page_number - 1) * rows_per_page + skip_firms)
+
+        # drop anything written after the last checkpointed firm, then replay what's committed
+        self.record_output.resume(committed_position)
+
+        view_state = None
+        queued = None
+
+        # iterate over whole or remaining data set
+        while record_count is None or (page_number - 1) * rows_per_page < record_count:
+            turbotlib.log("Requesting rows %d - %d" % ((page_number - 1) * rows_per_page, page_number * rows_per_page))
+
+            # the first page is sought directly, the rest follow the pager from it
+            if view_state is None and seeked is None:
+                seeked = self.seek_page(url, page_number, seed, rows_per_page)
+
+            response, view_state, firms = self.queue_page(url, page_number, view_state, skip_firms, seeked)
+            seeked = None
+            skip_firms = 0
+
+            # Ensure the number of records haven't changed during run
+            check_count = response.record_count
+            turbotlib.save_var("check_count", check_count)
+            metrics.set_gauge("firms.total", check_count)
+            if record_count is not None and record_count != check_count:
+                self.reset_state()
+                raise Exception("The data set changed during parsing, we need a re-run.")
+            else:
+                record_count = check_count
+
+            if not record_count > 0:
+                raise Exception("The data set is empty.")
+
+            # the previous page is written while this one's firms are already on the pool
+            if queued is not None:
+                self.write_page(queued, page_number - 1)
+                turbotlib.save_var("page", page_number)
+
+            queued = firms
+            page_number += 1
+
+        if queued is not None:
+            self.write_page(queued, page_number - 1)
+            turbotlib.save_var("page", page_number)
+
+        turbotlib.log("Run finished!")
+        self.export_records()
+        self.publish_changes()
+        self.reset_state()
+
+
+    ##
+    # process_shard will crawl one shard's range of result pages as a worker of a sharded run. Progress is kept in the
+    # shard's own journal rather than the turbot's page counter, so a re-run worker resumes after its last completed
+    # firm.
+    #
+    # @param url The url of the form to process
+    # @param seed The response to the seed request, the shard starts by seeking from it
+    # @param first_page The first page of the shard
+    # @param last_page The last page of the shard
+    # @param record_count The number of records the coordinator planned the shards around
+    # @param rows_per_page The number of rows on a result page
+
+    def process_shard(self, url, seed, first_page, last_page, record_count, rows_per_page):
+        page_number = first_page
+        skip_firms = 0
+        committed_position = self.journal.committed_position()
+
+        if committed_position is not None:
+            page_number = self.journal.last_page()
+            skip_firms = self.journal.completed_firms(page_number)
+            turbotlib.log("Resuming shard from page {0}, firm {1}".format(page_number, skip_firms + 1))
+
+        self.record_output.resume(committed_position)
+        metrics.set_gauge("firms.total",
+                          min(record_count, last_page * rows_per_page) - (first_page - 1) * rows_per_page)
+        metrics.set_gauge("firms.resumed", (page_number - first_page) * rows_per_page + skip_firms)
+
+        view_state = None
+        queued = None
+
+        while page_number <= last_page:
+            turbotlib.log("Requesting rows %d - %d" % ((page_number - 1) * rows_per_page, page_number * rows_per_page))
+
+            seeked = self.seek_page(url, page_number, seed, rows_per_page) if view_state is None else None
+            response, view_state, firms = self.queue_page(url, page_number, view_state, skip_firms, seeked)
+            skip_firms = 0
+
+            # Every shard must see the data set the coordinator split
+            if response.record_count != record_count:
+                raise DatasetChanged("Page %d reports %s records, expected %d" % (page_number, response.record_count,
+                                                                                  record_count))
+
+            # the previous page is written while this one's firms are already on the pool
+            if queued is not None:
+                self.write_page(queued, page_number - 1)
+
+            queued = firms
+            page_number += 1
+
+        if queued is not None:
+            self.write_page(queued, page_number - 1)
+
+        mark_done(self.data_dir, first_page, last_page)
+        turbotlib.log("Shard finished!")
+
+
+    ##
+    # process_shards will coordinate a sharded run. The reported record count is split into page ranges, one per worker
+    # process, and once every worker has finished its records are merged into the output in page order. Re-running after
+    # a failure restarts the workers, which resume from their own journals as long as the record count hasn't moved.
+    #
+    # @param url The url of the form to process
+    # @param seed The response to the seed request
+
+    def process_shards(self, url, seed):
+        rows_per_page, first = self.detect_rows_per_page(url, seed)
+        record_count = first.record_count
+
+        if not record_count > 0:
+            raise Exception("The data set is empty.")
+
+        plans = plan_shards(record_count, rows_per_page, self.shard_count)
+        budgets = share_budgets(self.rate_limiter.ceilings, self.rate_limiter.burst, len(plans))
+        shard_run = ShardRun(os.path.join(bot_directory, "scraper.py"), self.data_dir, record_count, rows_per_page,
+                             plans, budgets)
+
+        # caches outlive the run as they would in a single process, everything else is this run's progress
+        kept = ["firms.db", "firms.db-wal", "firms.db-shm", "history.db", "history.db-wal", "history.db-shm"]
+        if self.keep_individuals:
+            kept += ["individuals.db", "individuals.db-wal", "individuals.db-shm"]
+
+        try:
+            previous_plan = turbotlib.get_var("shard_plan")
+        except KeyError:
+            previous_plan = None
+
+        plan = [record_count, rows_per_page, [list(pages) for pages in plans]]
+        if previous_plan != plan:
+            shard_run.remove(kept)
+            turbotlib.save_var("shard_plan", plan)
+
+        turbotlib.log("Crawling %d records in %d shards" % (record_count, len(plans)))
+        metrics.set_gauge("firms.total", record_count)
+
+        shard_run.start()
+        failed, changed = shard_run.wait()
+
+        if changed:
+            shard_run.remove(kept)
+            turbotlib.save_var("shard_plan", None)
+            self.reset_state()
+            raise Exception("The data set changed during parsing, we need a re-run.")
+
+        if len(failed) > 0:
+            raise Exception("Shards %s failed, re-run to resume them." % ", ".join([str(shard) for shard in failed]))
+
+        self.record_output.resume(None)
+        merged = shard_run.merge(self.record_writer, lambda directory: RecordWriter(directory, self.record_compression))
+        turbotlib.log("Merged %d records from %d shards" % (merged, len(plans)))
+
+        if self.licence_writer is not None:
+            shard_run.merge(self.licence_writer,
+                            lambda directory: RecordWriter(directory, self.record_compression, name="licences.dump"))
+
+        shard_run.remove(kept)
+        turbotlib.save_var("shard_plan", None)
+        turbotlib.log("Run finished!")
+        self.export_records()
+        self.publish_changes()
+        self.reset_state()
+
+
+    ##
+    # export_records will bulk load a finished run's records from the dump into the export formats asked for
+
+    def export_records(self):
+        if self.export is None:
+            return
+
+        counts = self.export.write(self.record_writer.read())
+        turbotlib.log("Exported %d firms, %d locations, %d categories and %d individuals" %
+                      (counts['firms'], counts['locations'], counts['categories'], counts['individuals']))
+
+
+    ##
+    # publish_changes will write the change feed of a finished run. The run's records are read back from the dump into
+    # the snapshot, diffed against the previous run's and then kept for the next run to diff against. Entries carry the
+    # record as scraped this run, or as last published for a removal.
+
+    def publish_changes(self):
+        if self.snapshot is None:
+            return
+
+        loaded = self.snapshot.load(self.record_writer.read())
+
+        counts = {'added': 0, 'modified': 0, 'removed': 0}
+        self.change_writer.resume(None)
+        for change, record in self.snapshot.changes():
+            self.change_writer.write(encode_change(change, record))
+            counts[change] += 1
+
+        self.change_writer.checkpoint()
+        if self.change_feed == "instead":
+            self.change_writer.remove()
+
+        self.snapshot.promote()
+
+        for change, count in counts.items():
+            metrics.set_gauge("changes." + change, count)
+
+        turbotlib.log("Change feed over %d records: %d added, %d modified, %d removed" %
+                      (loaded, counts['added'], counts['modified'], counts['removed']))
+
+
+    ##
+    # emit_metrics will log a metrics snapshot and append it to the run's metrics file
+    #
+    # @param snapshot The json encoded snapshot
+
+    def emit_metrics(self, snapshot):
+        turbotlib.log("Metrics: " + snapshot)
+
+        with open('%s/metrics.jsonl' % self.data_dir, "a") as metrics_file:
+            metrics_file.write(snapshot + "\n")
+
+    ##
+    # open will start the run's profiler and metrics reporter and open its caches, journal, record dumps and worker
+    # pools in the data dir, resolving the turbot's data dir if none was configured. Helpers like process_details or
+    # get_firm_rows can be called once it's open.
+    #
+    # @return The crawler, for chaining
+
+    def open(self):
+        turbotlib.log("Starting run...")
+
+        if self.data_dir is None:
+            self.data_dir = turbotlib.data_dir()
+
+        self.profiler = None
+        if self.profiler_kind is not None:
+            self.profiler = RunProfiler(self.profiler_kind, self.data_dir)
+            self.profiler.start()
+
+        # each run's snapshots start a new metrics file, keeping the previous run's alongside
+        metrics_path = '%s/metrics.jsonl' % self.data_dir
+        if os.path.exists(metrics_path):
+            os.rename(metrics_path, metrics_path + ".1")
+
+        self.metrics_reporter = metrics.MetricsReporter(self.metrics_interval, self.emit_metrics)
+        if self.metrics_interval > 0:
+            self.metrics_reporter.start()
+        # create individuals cache
+        self.individuals_cache = IndividualsCache('%s/individuals.db' % self.data_dir,
+                                                  self.individuals_ttl if self.keep_individuals else None)
+
+        # create the cache of last emitted records per firm, kept between runs for incremental crawls
+        self.firm_cache = FirmCache('%s/firms.db' % self.data_dir, self.firm_refresh_age)
+
+        # create the cache of each firm's and individual's history, kept between runs
+        if self.cache_history:
+            self.history_cache = HistoryCache('%s/history.db' % self.data_dir, self.history_max_age)
+
+        # open the checkpoint journal of the run in progress, if any
+        self.journal = CheckpointJournal('%s/checkpoint.journal' % self.data_dir)
+
+        # records go to stdout and the dump as each firm completes, shard workers leave them for the coordinator to
+        # merge. The licence transformer can run in process alongside, its output going to its own dump or to stdout
+        # instead.
+        output_stream = sys.stdout if self.shard_pages is None else None
+        self.licence_writer = None
+        if self.licence_output is not None:
+            if self.licence_output not in ("alongside", "instead"):
+                raise ValueError("Unsupported licence output: %s" % self.licence_output)
+
+            self.licence_writer = RecordWriter(self.data_dir, self.record_compression, self.record_rotate_bytes,
+                                               name="licences.dump",
+                                               stream=output_stream if self.licence_output == "instead" else None)
+
+        # the change feed is published once the run's finished, against the snapshot of the previous run
+        if self.change_feed is not None and self.shard_pages is None:
+            if self.change_feed not in ("alongside", "instead"):
+                raise ValueError("Unsupported change feed: %s" % self.change_feed)
+
+            if self.change_feed == "instead" and self.licence_output == "instead":
+                raise ValueError("The change feed and the licence output can't both replace the records")
+
+            self.snapshot = Snapshot('%s/snapshot.db' % self.data_dir)
+            self.change_writer = RecordWriter(self.data_dir, self.record_compression, name="changes.dump",
+                                              stream=output_stream if self.change_feed == "instead" else None)
+
+        # as are the exports, from the dump before it's removed
+        if len(self.export_formats) > 0 and self.shard_pages is None:
+            self.export = Export(self.data_dir, self.export_formats)
+
+        records_on_stream = self.licence_output != "instead" and self.change_feed != "instead"
+        self.record_writer = RecordWriter(self.data_dir, self.record_compression, self.record_rotate_bytes,
+                                          stream=output_stream if records_on_stream else None)
+        self.record_output = RecordOutput(self.record_writer, self.licence_writer,
+                                          keep_licences=self.licence_output == "alongside")
+
+        thread_wrapper = self.profiler.profile_thread if self.profiler is not None else None
+        self.firm_pool = WorkerPool(self.firm_workers, "firm", thread_wrapper)
+        self.individual_pool = WorkerPool(self.individual_workers, "individual", thread_wrapper)
+
+        return self
+
+    ##
+    # crawl will scrape the form from its first page, as a whole, as a shard worker or by coordinating shards. The
+    # crawler must be open.
+    #
+    # @return The exit status for the process
+
+    def crawl(self):
+        turbotlib.log("Getting initial view state...")
+        init_req      = self.retrieve(self.url_start, "GET", "", "page")
+        document = parse_html(init_req.text)
+
+        initial_view_state = {'view'      : urllib.quote(document.find(id='__VIEWSTATE')['value']),
+                              'validation': urllib.quote(document.find(id='__EVENTVALIDATION')['value']),
+                              'generator' : urllib.quote(document.find(id='__VIEWSTATEGENERATOR')['value'])}
+
+        # first request returns junk data, discard it
+        seed, _ = self.process_page(self.url_start, 1, initial_view_state, True)
+
+        exit_status = 0
+        if self.shard_pages is not None:
+            try:
+                first_page, last_page = [int(page) for page in self.shard_pages.split(":")]
+                self.process_shard(self.url_start, seed, first_page, last_page, self.shard_record_count,
+                                   self.shard_rows_per_page)
+            except DatasetChanged as e:
+                turbotlib.log("The data set changed during parsing: " + str(e))
+                exit_status = DATASET_CHANGED_EXIT
+        elif self.shard_count > 1:
+            self.process_shards(self.url_start, seed)
+        else:
+            self.process_pages(self.url_start, seed)
+
+        return exit_status
+
+    ##
+    # close will let the worker pools drain, then close everything open() opened and stop profiling
+
+    def close(self):
+        for pool in (self.firm_pool, self.individual_pool):
+            if pool is not None:
+                pool.shutdown()
+
+        for resource in (self.individuals_cache, self.firm_cache, self.history_cache, self.journal, self.record_output,
+                         self.snapshot, self.change_writer):
+            if resource is not None:
+                resource.close()
+
+        if self.metrics_reporter is not None:
+            self.metrics_reporter.stop()
+
+        if self.profiler is not None:
+            turbotlib.log("Profile written to " + self.profiler.stop())
+
+        self.firm_pool = self.individual_pool = None
+        self.individuals_cache = self.firm_cache = self.history_cache = self.journal = None
+        self.record_output = self.record_writer = self.licence_writer = None
+        self.snapshot = self.change_writer = self.export = None
+        self.metrics_reporter = self.profiler = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    ##
+    # run will perform a whole scrape. A run that fails is left to end the process, its worker threads are daemons.
+    #
+    # @return The exit status for the process
+
+    def run(self):
+        self.open()
+        exit_status = self.crawl()
+        self.close()
+        return exit_status
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import sqlite3
+import metrics
+
+
+# Normalised layout of the export: a firm's locations, each with the categories it's registered in and the individuals
+# of its roster, each of whom has categories of their own
+tables = [("firms", [("id", "INTEGER PRIMARY KEY"), ("name", "TEXT NOT NULL"), ("all_jurisdictions", "TEXT"),
+                     ("historical_names", "TEXT"), ("source_url", "TEXT"), ("sample_date", "TEXT")]),
+          ("locations", [("id", "INTEGER PRIMARY KEY"), ("firm_id", "INTEGER NOT NULL"), ("jurisdiction", "TEXT"),
+                         ("terms", "TEXT"), ("contact", "TEXT")]),
+          ("categories", [("location_id", "INTEGER NOT NULL"), ("category", "TEXT NOT NULL"), ("from_date", "TEXT"),
+                          ("to_date", "TEXT"), ("status", "TEXT")]),
+          ("individuals", [("id", "INTEGER PRIMARY KEY"), ("location_id", "INTEGER NOT NULL"),
+                           ("name", "TEXT NOT NULL"), ("jurisdiction", "TEXT"), ("terms", "TEXT"),
+                           ("contact", "TEXT")]),
+          ("individual_categories", [("individual_id", "INTEGER NOT NULL"), ("category", "TEXT NOT NULL"),
+                                     ("from_date", "TEXT"), ("to_date", "TEXT"), ("status", "TEXT")])]
+
+# Built once the rows are in, which is cheaper than keeping them up to date through the load
+indexes = ["CREATE INDEX firms_name ON firms (name)",
+           "CREATE INDEX locations_firm ON locations (firm_id)",
+           "CREATE INDEX locations_jurisdiction ON locations (jurisdiction)",
+           "CREATE INDEX categories_location ON categories (location_id)",
+           "CREATE INDEX categories_category ON categories (category, status)",
+           "CREATE INDEX individuals_location ON individuals (location_id)",
+           "CREATE INDEX individuals_name ON individuals (name)",
+           "CREATE INDEX individuals_jurisdiction ON individuals (jurisdiction)",
+           "CREATE INDEX individual_categories_individual ON individual_categories (individual_id)",
+           "CREATE INDEX individual_categories_category ON individual_categories (category, status)"]
+
+
+##
+# Export bulk loads a run's records into a normalised, indexed SQLite database and optionally Parquet files, one per
+# table, for querying without re-parsing the dump. Records repeat their firm's fields on every category and their
+# location's roster on every category of the location, both are stored once. Rows are inserted in batches inside a
+# single transaction into a file the previous export is only replaced with once it's complete.
+
+class Export(object):
+
+    supported_formats = ("sqlite", "parquet")
+
+    def __init__(self, directory, formats, batch_size=5000):
+        for export_format in formats:
+            if export_format not in self.supported_formats:
+                raise ValueError("Unsupported export format: %s" % export_format)
+
+        # fail before the run rather than after it if Parquet can't be written
+        if "parquet" in formats:
+            import pyarrow
+
+        self.directory = directory
+        self.formats = formats
+        self.batch_size = batch_size
+        self.path = os.path.join(directory, "export.db")
+
+    ##
+    # write will export a run's records
+    #
+    # @param records An iterable of json encoded records, e.g. read back from the records dump
+    #
+    # @return A dictionary of the number of rows in each table
+
+    def write(self, records):
+        partial = self.path + ".partial"
+        if os.path.exists(partial):
+            os.remove(partial)
+
+        db = sqlite3.connect(partial)
+        try:
+            # nothing's durable until the finished file is renamed in place
+            db.execute("PRAGMA journal_mode=OFF")
+            db.execute("PRAGMA synchronous=OFF")
+
+            for table, columns in tables:
+                db.execute("CREATE TABLE %s (%s)" % (table, ", ".join([" ".join(column) for column in columns])))
+
+            with metrics.timed("export.load"):
+                counts = self._load(db, records)
+
+            with metrics.timed("export.index"):
+                for index in indexes:
+                    db.execute(index)
+
+            db.commit()
+
+            if "parquet" in self.formats:
+                with metrics.timed("export.parquet"):
+                    self._write_parquet(db)
+        finally:
+            db.close()
+
+        if "sqlite" in self.formats:
+            os.rename(partial, self.path)
+        else:
+            os.remove(partial)
+
+        return counts
+
+    def _load(self, db, records):
+        batches = dict([(table, []) for table, _ in tables])
+        inserts = dict([(table, "INSERT INTO %s VALUES (%s)" % (table, ", ".join(["?"] * len(columns))))
+                        for table, columns in tables])
+        counts = dict([(table, 0) for table, _ in tables])
+
+        def add(table, row):
+            batch = batches[table]
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                db.executemany(inserts[table], batch)
+                counts[table] += len(batch)
+                del batch[:]
+
+        # flatten numbers each location within its firm, a location starts wherever that number changes
+        firm_id = 0
+        firm_key = None
+        location_id = 0
+        location_key = None
+        individual_id = 0
+
+        for record in records:
+            fields = json.loads(record)
+
+            key = (fields.get('firm'), fields.get('all_jurisdictions'), fields.get('source_url'))
+            if key != firm_key:
+                firm_id += 1
+                firm_key = key
+                location_key = None
+                add("firms", (firm_id, fields.get('firm'), fields.get('all_jurisdictions'),
+                              fields.get('historical_names'), fields.get('source_url'), fields.get('sample_date')))
+
+            if 'jurisdiction' not in fields:
+                continue
+
+            individuals = fields.get('individuals')
+            if fields.get('location') != location_key:
+                location_id += 1
+                location_key = fields.get('location')
+                add("locations", (location_id, firm_id, fields['jurisdiction'], fields.get('terms'),
+                                  fields.get('contact')))
+
+                for individual in individuals or []:
+                    individual_id += 1
+                    add("individuals", (individual_id, location_id, individual.get('name'),
+                                        individual.get('jurisdiction'), individual.get('terms') or None,
+                                        individual.get('contact') or None))
+
+                    for individual_category in json.loads(individual.get('categories') or "[]"):
+                        add("individual_categories", (individual_id, individual_category['category'],
+                                                      individual_category.get('from'), individual_category.get('to'),
+                                                      individual_category.get('status')))
+
+            if 'category' in fields:
+                add("categories", (location_id, fields['category'], fields.get('from'), fields.get('to'),
+                                   fields.get('status')))
+
+        for table, batch in batches.items():
+            db.executemany(inserts[table], batch)
+            counts[table] += len(batch)
+
+        return counts
+
+    def _write_parquet(self, db):
+        import pyarrow
+        import pyarrow.parquet
+
+        directory = os.path.join(self.directory, "export")
+        if not os.path.isdir(directory):
+            os.mkdir(directory)
+
+        for table, columns in tables:
+            names = [column[0] for column in columns]
+            types = [pyarrow.int64() if kind.startswith("INTEGER") else pyarrow.string() for _, kind in columns]
+            schema = pyarrow.schema(list(zip(names, types)))
+
+            path = os.path.join(directory, table + ".parquet")
+            writer = pyarrow.parquet.ParquetWriter(path + ".partial", schema)
+            try:
+                cursor = db.execute("SELECT %s FROM %s" % (", ".join(names), table))
+                while True:
+                    rows = cursor.fetchmany(self.batch_size)
+                    if len(rows) == 0:
+                        break
+
+                    arrays = [pyarrow.array([row[index] for row in rows], type=types[index])
+                              for index in range(len(names))]
+                    writer.write_table(pyarrow.Table.from_arrays(arrays, names=names))
+            finally:
+                writer.close()
+
+            os.rename(path + ".partial", path)
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+import time
+import hashlib
+import sqlite3
+import metrics
+
+
+##
+# firm_fingerprint will identify a firm's listing on the result table. Any change to the firm's name or to the
+# jurisdictions it's listed in produces a new fingerprint.
+#
+# @param firm_name The name of the firm
+# @param all_jurisdictions The jurisdictions cell of the result table
+#
+# @return A hex digest
+
+def firm_fingerprint(firm_name, all_jurisdictions):
+    return hashlib.sha1((firm_name + u"\0" + all_jurisdictions).encode("utf-8")).hexdigest()
+
+
+##
+# FirmCache remembers the records last emitted for each firm listing, keyed by its fingerprint, across runs. Records are
+# kept exactly as they were written, one json line each, so an unchanged firm is re-emitted without decoding them.
+# Entries older than `max_age` seconds are treated as missing so every firm is still refetched periodically. The size
+# of each firm's rosters is remembered too, so the scheduler can estimate what a firm will cost before fetching it.
+
+class FirmCache(object):
+
+    record_format = 2
+
+    def __init__(self, path, max_age):
+        self.max_age = max_age
+
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+
+        # records cached in an older format (decoded lists, or lines without each location's position) start over
+        if self.db.execute("PRAGMA user_version").fetchone()[0] < self.record_format:
+            self.db.execute("DROP TABLE IF EXISTS firms")
+            self.db.execute("PRAGMA user_version=%d" % self.record_format)
+
+        self.db.execute("CREATE TABLE IF NOT EXISTS firms("
+                        "fingerprint TEXT PRIMARY KEY, firm TEXT NOT NULL, sample_date TEXT NOT NULL, "
+                        "records TEXT NOT NULL, fetched_at REAL NOT NULL)")
+        self.db.execute("DELETE FROM firms WHERE fetched_at < ?", (time.time() - self.max_age,))
+
+        self.db.execute("CREATE TABLE IF NOT EXISTS rosters("
+                        "firm TEXT NOT NULL, jurisdiction TEXT NOT NULL, size INTEGER NOT NULL, "
+                        "PRIMARY KEY (firm, jurisdiction))")
+        self.db.commit()
+
+        # read by the worker threads, so served from memory rather than this thread's connection
+        self.roster_sizes = {}
+        for firm_name, jurisdiction, size in self.db.execute("SELECT firm, jurisdiction, size FROM rosters"):
+            self.roster_sizes.setdefault(firm_name, {})[jurisdiction] = size
+
+    ##
+    # get will look up the records of an unchanged firm, restamped with the current sample date
+    #
+    # @param fingerprint The fingerprint of the firm's listing
+    # @param sample_date The sample date of this run
+    #
+    # @return The list of json encoded records, or None if the firm is new, changed or due a refetch
+
+    def get(self, fingerprint, sample_date):
+        with metrics.timed("db.firms.get"):
+            row = self.db.execute("SELECT sample_date, records FROM firms WHERE fingerprint=? AND fetched_at >= ?",
+                                  (fingerprint, time.time() - self.max_age)).fetchone()
+
+        if row is None:
+            return None
+
+        # sample dates are isoformat timestamps, they can't collide with anything else in a record
+        records = row[1].replace('"sample_date": "%s"' % row[0], '"sample_date": "%s"' % sample_date)
+        return records.split("\n")
+
+    ##
+    # store will remember the records emitted for a freshly fetched firm
+    #
+    # @param fingerprint The fingerprint of the firm's listing
+    # @param firm_name The name of the firm
+    # @param sample_date The sample date the records were stamped with
+    # @param records The list of json encoded records
+
+    def store(self, fingerprint, firm_name, sample_date, records):
+        with metrics.timed("db.firms.store"):
+            self.db.execute("INSERT OR REPLACE INTO firms (fingerprint, firm, sample_date, records, fetched_at) "
+                            "VALUES (?, ?, ?, ?, ?)",
+                            (fingerprint, firm_name, sample_date, "\n".join(records), time.time()))
+
+    ##
+    # roster_size will give the number of individuals a firm's roster listed last time it was walked
+    #
+    # @param firm_name The name of the firm
+    # @param jurisdiction The jurisdiction of the roster, or None for the largest of the firm's rosters
+    #
+    # @return The number of individuals, 0 if the roster isn't known
+
+    def roster_size(self, firm_name, jurisdiction=None):
+        sizes = self.roster_sizes.get(firm_name, {})
+        if jurisdiction is not None:
+            return sizes.get(jurisdiction, 0)
+
+        return max(sizes.values()) if len(sizes) > 0 else 0
+
+    ##
+    # store_roster_size will remember the number of individuals listed on a firm's roster
+    #
+    # @param firm_name The name of the firm
+    # @param jurisdiction The jurisdiction of the roster
+    # @param size The number of individuals
+
+    def store_roster_size(self, firm_name, jurisdiction, size):
+        self.db.execute("INSERT OR REPLACE INTO rosters (firm, jurisdiction, size) VALUES (?, ?, ?)",
+                        (firm_name, jurisdiction, size))
+        self.roster_sizes.setdefault(firm_name, {})[jurisdiction] = size
+
+    def commit(self):
+        self.db.commit()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+
+import re
+import json
+
+
+whitespace_regex = re.compile(r'\s+')
+
+
+##
+# normalise_contact will collapse the text cells of a contact information table into one line
+#
+# @param cells The bs4 cells of the contact table
+#
+# @return The contact string
+
+def normalise_contact(cells):
+    parts = []
+    for cell in cells:
+        parts.append("\n")
+        parts.append("\n".join([x.strip() for x in cell.strings]))
+
+    return whitespace_regex.sub(' ', "".join(parts).replace('View Other Addresses', '')).strip()
+
+
+##
+# Category is one registration category held in a location. Unset dates and status are left out of its fields.
+
+class Category(object):
+
+    __slots__ = ('category', 'from_date', 'to', 'status')
+
+    def __init__(self, category):
+        self.category = category
+        self.from_date = None
+        self.to = None
+        self.status = None
+
+    def fields(self):
+        fields = {'category': self.category}
+
+        if self.from_date is not None:
+            fields['from'] = self.from_date
+
+        if self.to is not None:
+            fields['to'] = self.to
+
+        if self.status is not None:
+            fields['status'] = self.status
+
+        return fields
+
+    @staticmethod
+    def from_fields(fields):
+        category = Category(fields['category'])
+        category.from_date = fields.get('from')
+        category.to = fields.get('to')
+        category.status = fields.get('status')
+        return category
+
+
+##
+# Location is a firm's registration in one jurisdiction, current or historical. `individuals` is None when the
+# location has no roster link, otherwise whatever the scraper uses to track the roster (a pending job, then names).
+
+class Location(object):
+
+    __slots__ = ('jurisdiction', 'terms', 'contact', 'categories', 'individuals')
+
+    def __init__(self, jurisdiction):
+        self.jurisdiction = jurisdiction
+        self.terms = None
+        self.contact = None
+        self.categories = []
+        self.individuals = None
+
+    def fields(self):
+        fields = {'jurisdiction': self.jurisdiction}
+
+        if self.terms is not None:
+            fields['terms'] = self.terms
+
+        if self.contact is not None:
+            fields['contact'] = self.contact
+
+        return fields
+
+    ##
+    # encode will give the location's fields along with its categories, e.g. to cache it. The roster isn't included.
+    #
+    # @return A dictionary, see from_fields
+
+    def encode(self):
+        encoded = self.fields()
+        encoded['categories'] = [category.fields() for category in self.categories]
+        return encoded
+
+    @staticmethod
+    def from_fields(fields):
+        location = Location(fields['jurisdiction'])
+        location.terms = fields.get('terms')
+        location.contact = fields.get('contact')
+        location.categories = [Category.from_fields(category) for category in fields.get('categories', [])]
+        return location
+
+
+##
+# Individual is a registered individual's registration with one firm in one jurisdiction
+
+class Individual(Location):
+
+    __slots__ = ('name', 'firm')
+
+    def __init__(self, name, jurisdiction):
+        Location.__init__(self, jurisdiction)
+        self.name = name
+        self.firm = None
+
+    ##
+    # row will give the individual as stored in the individuals cache
+    #
+    # @return A tuple of jurisdiction, name, firm, terms, contact and json encoded categories
+
+    def row(self):
+        return (self.jurisdiction,
+                self.name,
+                self.firm,
+                self.terms if self.terms is not None else '',
+                self.contact if self.contact is not None else '',
+                json.dumps([category.fields() for category in self.categories]))
+
+
+##
+# Firm is everything scraped about one firm listed on the result table
+
+class Firm(object):
+
+    __slots__ = ('name', 'all_jurisdictions', 'historical_names', 'locations', 'sample_date', 'source_url')
+
+    def __init__(self, name):
+        self.name = name
+        self.all_jurisdictions = None
+        self.historical_names = []
+        self.locations = []
+        self.sample_date = None
+        self.source_url = None
+
+    def fields(self):
+        return {'firm': self.name,
+                'all_jurisdictions': self.all_jurisdictions,
+                'sample_date': self.sample_date,
+                'source_url': self.source_url,
+                'historical_names': "".join([name + "\n\n" for name in self.historical_names])}
+
+    ##
+    # flatten will generate the firm's output records, one per category of each location (or one per location
+    # without categories, or a single record for a firm without locations). Each location's records carry its position
+    # in the firm, starting at 1, as `location`, which is all that tells two registrations in a jurisdiction apart.
+    #
+    # @param encode_individuals Called with the position and Location of a location that has a roster, returns its
+    # individuals as a json array
+    #
+    # @return A generator of (fields, individuals json or None) tuples, see encode_record
+
+    def flatten(self, encode_individuals):
+        primary = self.fields()
+
+        if len(self.locations) == 0:
+            yield primary, None
+            return
+
+        for position, location in enumerate(self.locations, 1):
+            individuals = encode_individuals(position, location) if location.individuals is not None else None
+
+            detail = dict(primary)
+            detail.update(location.fields())
+            detail['location'] = position
+
+            if len(location.categories) == 0:
+                yield detail, individuals
+                continue
+
+            for category in location.categories:
+                record = dict(detail)
+                record.update(category.fields())
+                yield record, individuals
+
+
+##
+# encode_individuals will serialise individuals one at a time into a json array
+#
+# @param rows An iterable of user rows, e.g. streamed from the individuals cache
+#
+# @return The json array
+
+def encode_individuals(rows):
+    return "[" + ", ".join([json.dumps(row) for row in rows]) + "]"
+
+
+##
+# encode_record will serialise an output record, splicing in its already encoded individuals so the same array isn't
+# rebuilt for every category of a location
+#
+# @param fields The record's fields
+# @param individuals The json array of the record's individuals, or None
+#
+# @return The json encoded record
+
+def encode_record(fields, individuals=None):
+    encoded = json.dumps(fields)
+
+    if individuals is None:
+        return encoded
+
+    return encoded[:-1] + ', "individuals": ' + individuals + '}'
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+import metrics
+
+
+##
+# panel_digest will identify the current registrations shown on a details response
+#
+# @param markup The registrations table of the details response, see get_registrations_markup
+#
+# @return A hex digest
+
+def panel_digest(markup):
+    if isinstance(markup, unicode):
+        markup = markup.encode("utf-8")
+
+    return hashlib.sha1(markup).hexdigest()
+
+
+##
+# HistoryCache remembers what was scraped from the history postback of each firm and individual across runs. An entry
+# is keyed on the entity and the digest of its current registrations panel: historical registrations are by definition
+# mostly immutable, and anything moving into the history also changes the current panel, so while the digest holds
+# the history postback can be skipped. Entries older than `max_age` seconds are treated as missing.
+
+class HistoryCache(object):
+
+    def __init__(self, path, max_age, batch_size=500):
+        self.max_age = max_age
+        self.batch_size = batch_size
+        self.pending = 0
+        self.lock = threading.Lock()
+
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS history("
+                        "entity TEXT PRIMARY KEY, digest TEXT NOT NULL, history TEXT NOT NULL, "
+                        "fetched_at REAL NOT NULL)")
+        self.db.execute("DELETE FROM history WHERE fetched_at < ?", (time.time() - self.max_age,))
+        self.db.commit()
+
+    ##
+    # get will look up the history of an entity whose current registrations are unchanged
+    #
+    # @param entity The identity of the firm or individual
+    # @param digest The panel_digest of its current registrations
+    #
+    # @return The history as it was stored, or None if it has to be fetched
+
+    def get(self, entity, digest):
+        with metrics.timed("db.history.get"), self.lock:
+            row = self.db.execute("SELECT history FROM history WHERE entity=? AND digest=? AND fetched_at >= ?",
+                                  (entity, digest, time.time() - self.max_age)).fetchone()
+
+        if row is None:
+            metrics.increment("history.misses")
+            return None
+
+        metrics.increment("history.hits")
+        return json.loads(row[0])
+
+    ##
+    # store will remember the history fetched for an entity
+    #
+    # @param entity The identity of the firm or individual
+    # @param digest The panel_digest of its current registrations
+    # @param history Anything json serialisable
+
+    def store(self, entity, digest, history):
+        with metrics.timed("db.history.store"), self.lock:
+            self.db.execute("INSERT OR REPLACE INTO history (entity, digest, history, fetched_at) VALUES (?, ?, ?, ?)",
+                            (entity, digest, json.dumps(history), time.time()))
+
+            self.pending += 1
+            if self.pending >= self.batch_size:
+                self.db.commit()
+                self.pending = 0
+
+    def commit(self):
+        with self.lock:
+            self.db.commit()
+            self.pending = 0
+
+    def close(self):
+        self.commit()
+        self.db.close()
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+
+import time
+import sqlite3
+import threading
+import metrics
+
+
+def dict_factory(cursor, row):
+    d = {}
+    for idx, col in enumerate(cursor.description):
+        d[col[0]] = row[idx]
+    return d
+
+
+##
+# IndividualsCache stores the license data of registered individuals so each person's details are only fetched once.
+# Rows are keyed on (jurisdiction, name, firm), inserted in batches and committed every `batch_size` rows rather than
+# per firm. Alongside them a persons index records whose details page has been fetched, keyed on the person's name
+# and the firm whose roster listed them, so a (jurisdiction, firm) the details page didn't list this run isn't
+# refetched. With a `ttl` (in seconds) the cache is meant to outlive a run: rows older than the ttl are ignored and
+# pruned, everything else is served without going back to the network.
+
+class IndividualsCache(object):
+
+    columns = ("jurisdiction", "name", "firm", "terms", "contact", "categories")
+
+    def __init__(self, path, ttl=None, batch_size=500):
+        self.ttl = ttl
+        self.batch_size = batch_size
+        self.pending = 0
+        self.opened_at = time.time()
+        self.lock = threading.Lock()
+
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.row_factory = dict_factory
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+
+        # caches from before the table was keyed can't be upgraded in place, start them over
+        existing = [column['name'] for column in self.db.execute("PRAGMA table_info(individuals)")]
+        if len(existing) > 0 and "fetched_at" not in existing:
+            self.db.execute("DROP TABLE individuals")
+
+        self.db.execute("CREATE TABLE IF NOT EXISTS individuals("
+                        "jurisdiction TEXT NOT NULL, name TEXT NOT NULL, firm TEXT NOT NULL, "
+                        "terms TEXT, contact TEXT, categories TEXT, fetched_at REAL NOT NULL, "
+                        "PRIMARY KEY (jurisdiction, name, firm))")
+
+        self.db.execute("CREATE TABLE IF NOT EXISTS persons("
+                        "name TEXT NOT NULL, firm TEXT NOT NULL, fetched_at REAL NOT NULL, PRIMARY KEY (name, firm))")
+
+        if self.ttl is not None:
+            self.db.execute("DELETE FROM individuals WHERE fetched_at < ?", (time.time() - self.ttl,))
+            self.db.execute("DELETE FROM persons WHERE fetched_at < ?", (time.time() - self.ttl,))
+
+        self.db.commit()
+
+    ##
+    # get will query for an individual in the cache
+    #
+    # @param name The individual's name
+    # @param jurisdiction The jurisdiction of the firm
+    # @param firm The name of the firm
+    #
+    # @return A user row or None
+
+    def get(self, name, jurisdiction, firm):
+        query = "SELECT jurisdiction, name, firm, terms, contact, categories FROM individuals " \
+                "WHERE jurisdiction=? AND name=? AND firm=? AND fetched_at >= ?"
+        oldest = time.time() - self.ttl if self.ttl is not None else 0
+
+        with metrics.timed("db.individuals.get"), self.lock:
+            return self.db.execute(query, (jurisdiction, name, firm, oldest)).fetchone()
+
+    ##
+    # iter_individuals will stream a firm's individuals out of the cache, one row at a time
+    #
+    # @param names The individuals' names, in roster order
+    # @param jurisdiction The jurisdiction of the firm
+    # @param firm The name of the firm
+    #
+    # @return A generator of user rows, skipping anyone no longer cached
+
+    def iter_individuals(self, names, jurisdiction, firm):
+        for name in names:
+            row = self.get(name, jurisdiction, firm)
+            if row is not None:
+                yield row
+
+    ##
+    # person_fetched will check whether an individual's details page has already been stored this run. Fetches kept
+    # from earlier runs don't count, the person may have registered in another jurisdiction since.
+    #
+    # @param name The individual's name
+    # @param firm The name of the firm whose roster listed them
+    #
+    # @return True if the details were stored since the cache was opened
+
+    def person_fetched(self, name, firm):
+        with metrics.timed("db.persons.get"), self.lock:
+            return self.db.execute("SELECT 1 FROM persons WHERE name=? AND firm=? AND fetched_at >= ?",
+                                   (name, firm, self.opened_at)).fetchone() is not None
+
+    ##
+    # count_persons will count the individuals whose details were fetched from a firm's roster
+    #
+    # @param firm The name of the firm whose roster listed them
+    #
+    # @return The number of individuals
+
+    def count_persons(self, firm):
+        oldest = time.time() - self.ttl if self.ttl is not None else 0
+
+        with metrics.timed("db.persons.count"), self.lock:
+            return self.db.execute("SELECT COUNT(*) AS persons FROM persons WHERE firm=? AND fetched_at >= ?",
+                                   (firm, oldest)).fetchone()['persons']
+
+    ##
+    # store will add the rows scraped from one individual's details. When the same (jurisdiction, name, firm) shows up
+    # more than once, e.g. current and historical registrations, the first row scraped wins.
+    #
+    # @param rows Tuples of jurisdiction, name, firm, terms, contact and json encoded categories
+    # @param person The (name, firm) the details were fetched for, marked as fetched in the persons index
+
+    def store(self, rows, person):
+        fetched_at = time.time()
+        seen = set()
+        batch = []
+
+        for row in rows:
+            if row[:3] not in seen:
+                seen.add(row[:3])
+                batch.append(tuple(row) + (fetched_at,))
+
+        with metrics.timed("db.individuals.store"), self.lock:
+            self.db.executemany("INSERT OR REPLACE INTO individuals "
+                                "(jurisdiction, name, firm, terms, contact, categories, fetched_at) "
+                                "VALUES (?, ?, ?, ?, ?, ?, ?)", batch)
+            self.db.execute("INSERT OR REPLACE INTO persons (name, firm, fetched_at) VALUES (?, ?, ?)",
+                            tuple(person) + (fetched_at,))
+
+            self.pending += len(batch)
+            if self.pending >= self.batch_size:
+                self.db.commit()
+                self.pending = 0
+
+    ##
+    # commit will flush any batched rows to disk
+
+    def commit(self):
+        with self.lock:
+            self.db.commit()
+            self.pending = 0
+
+    def close(self):
+        self.commit()
+        self.db.close()
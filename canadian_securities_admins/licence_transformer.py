@@ -1,31 +1,50 @@
+import os
 import sys
 import json
+import multiprocessing
 from datetime import datetime
 import turbotlib
 
+# Decoding is most of the work, use a faster codec when one is installed. Output always goes through the stdlib
+# encoder so it stays byte for byte the same.
+try:
+    import ujson as json_decoder
+except ImportError:
+    json_decoder = json
+
+
+# Global application configuration
+transform_processes = int(os.environ.get("CSA_TRANSFORM_PROCESSES", 1))
+transform_chunk_bytes = int(os.environ.get("CSA_TRANSFORM_CHUNK_KB", 1024)) * 1024
+
+
+# The dates come from a small set of distinct strings, so each is only parsed once
+parsed_dates = {}
+
 
 def date_formatter(date):
-    if len(date) <= 0 or date is None:
+    if date is None or len(date) <= 0:
         return None
 
+    try:
+        return parsed_dates[date]
+    except KeyError:
+        pass
+
     try:
         time = datetime.strptime(date, "%B %d, %Y").isoformat()[:-9]
         if len(time) <= 1:
             turbotlib.log("Failure parsing date: " + date)
-            return None
-
-        return time
+            time = None
     except:
         turbotlib.log("Failure parsing date: " + date)
-        return None
+        time = None
 
+    parsed_dates[date] = time
+    return time
 
-while True:
-    line = sys.stdin.readline()
-    if not line:
-        break
-    raw_record = json.loads(line)
 
+def transform_record(raw_record):
     license_record = {
         "company_name": raw_record.get('firm', 'Unknown'),
         "company_jurisdiction": raw_record.get('jurisdiction', 'Unknown'),
@@ -45,4 +64,46 @@ while True:
     if license_record['end_date'] is None:
         license_record.pop('end_date', None)
 
-    print json.dumps(license_record)
\ No newline at end of file
+    return license_record
+
+
+def encode_licence(raw_record):
+    return json.dumps(transform_record(raw_record))
+
+
+def transform_lines(lines):
+    return "".join([encode_licence(json_decoder.loads(line)) + "\n" for line in lines])
+
+
+def read_chunks(stream, chunk_bytes):
+    while True:
+        lines = stream.readlines(chunk_bytes)
+        if not lines:
+            break
+
+        yield lines
+
+
+def main():
+    chunks = read_chunks(sys.stdin, transform_chunk_bytes)
+
+    if transform_processes > 1:
+        # imap hands chunks out to the workers but yields their output in input order
+        pool = multiprocessing.Pool(transform_processes)
+        output = pool.imap(transform_lines, chunks)
+    else:
+        pool = None
+        output = (transform_lines(chunk) for chunk in chunks)
+
+    for transformed in output:
+        sys.stdout.write(transformed)
+
+    sys.stdout.flush()
+
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+
+import json
+import time
+import threading
+import functools
+
+
+# Global counters, gauges and histograms, shared by every worker
+counters = {}
+gauges = {}
+histograms = {}
+metrics_lock = threading.Lock()
+
+# Upper bounds, in seconds, of the histogram buckets
+histogram_buckets = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60)
+
+
+##
+# increment will add to a named counter
+#
+# @param name The counter name
+# @param value The amount to add
+
+def increment(name, value=1):
+    with metrics_lock:
+        counters[name] = counters.get(name, 0) + value
+
+
+##
+# set_gauge will record the current value of something
+#
+# @param name The gauge name
+# @param value The value
+
+def set_gauge(name, value):
+    with metrics_lock:
+        gauges[name] = value
+
+
+##
+# observe will add a sample to a named histogram
+#
+# @param name The histogram name
+# @param value The sample, in seconds for timings
+
+def observe(name, value):
+    with metrics_lock:
+        histogram = histograms.get(name)
+        if histogram is None:
+            histogram = histograms[name] = {'count': 0, 'sum': 0.0, 'min': value, 'max': value,
+                                            'buckets': [0] * (len(histogram_buckets) + 1)}
+
+        histogram['count'] += 1
+        histogram['sum'] += value
+        histogram['min'] = min(histogram['min'], value)
+        histogram['max'] = max(histogram['max'], value)
+
+        bucket = 0
+        while bucket < len(histogram_buckets) and value > histogram_buckets[bucket]:
+            bucket += 1
+
+        histogram['buckets'][bucket] += 1
+
+
+##
+# Timer is a context manager adding the time spent in its block to a histogram
+
+class Timer(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.started = None
+
+    def __enter__(self):
+        self.started = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        observe(self.name, time.time() - self.started)
+        return False
+
+
+##
+# timed will time a block of code
+#
+# @param name The histogram to add the time to
+#
+# @return A Timer
+
+def timed(name):
+    return Timer(name)
+
+
+##
+# instrument is a decorator timing every call of a function
+#
+# @param name The histogram to add the time to
+
+def instrument(name):
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with Timer(name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+##
+# snapshot will copy the current counter values
+#
+# @return A dictionary of counter name to value
+
+def snapshot():
+    with metrics_lock:
+        return dict(counters)
+
+
+##
+# full_snapshot will copy everything recorded so far
+#
+# @return A dictionary of counters, gauges and histograms (with their mean)
+
+def full_snapshot():
+    with metrics_lock:
+        summary = {}
+        for name, histogram in histograms.items():
+            summary[name] = dict(histogram, buckets=list(histogram['buckets']),
+                                 mean=histogram['sum'] / histogram['count'])
+
+        return {'counters': dict(counters), 'gauges': dict(gauges), 'histograms': summary,
+                'histogram_buckets': histogram_buckets}
+
+
+##
+# MetricsReporter periodically emits a machine readable snapshot of the run: requests/sec since the last report, firms
+# done against the total reported by the site, an ETA and everything in full_snapshot(). Each snapshot is handed to
+# `emit` as a json string.
+
+class MetricsReporter(object):
+
+    def __init__(self, interval, emit):
+        self.interval = interval
+        self.emit = emit
+        self.started = time.time()
+        self.stopped = threading.Event()
+        self.last_time = self.started
+        self.last_requests = 0
+        self.thread = None
+
+    ##
+    # report will build and emit one snapshot
+    #
+    # @return The snapshot dictionary
+
+    def report(self):
+        now = time.time()
+        metrics = full_snapshot()
+        counters_now = metrics['counters']
+
+        requests_made = counters_now.get("requests", 0)
+        firms_done = counters_now.get("firms.done", 0)
+        firms_total = metrics['gauges'].get("firms.total")
+        firms_skipped = metrics['gauges'].get("firms.resumed", 0)
+
+        elapsed = now - self.started
+        firm_rate = firms_done / elapsed if elapsed > 0 else 0.0
+
+        eta = None
+        if firms_total is not None and firm_rate > 0:
+            eta = max(0.0, (firms_total - firms_skipped - firms_done) / firm_rate)
+
+        metrics.update({'time': now,
+                        'elapsed': elapsed,
+                        'requests_per_second': (requests_made - self.last_requests) / max(1e-9, now - self.last_time),
+                        'firms_done': firms_done + firms_skipped,
+                        'firms_total': firms_total,
+                        'eta_seconds': eta})
+
+        self.last_time = now
+        self.last_requests = requests_made
+        self.emit(json.dumps(metrics, sort_keys=True))
+        return metrics
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.report()
+
+    ##
+    # start will report every interval seconds on a background thread
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="metrics-reporter")
+        self.thread.daemon = True
+        self.thread.start()
+
+    ##
+    # stop will end the background reports and emit a final one
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+        self.report()
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+import os
+import pstats
+import cProfile
+import threading
+
+
+##
+# RunProfiler profiles a whole run with either cProfile or pyinstrument. Neither sees beyond the thread it's started
+# on, so each worker thread started through profile_thread gets its own profile too. cProfile's are merged into one
+# report when the run stops. pyinstrument's call trees can't be merged, so its report has the main thread's followed
+# by each worker's, which is where the crawl's work shows up.
+
+class RunProfiler(object):
+
+    def __init__(self, kind, directory):
+        if kind not in ("cprofile", "pyinstrument"):
+            raise ValueError("Unsupported profiler: %s" % kind)
+
+        self.kind = kind
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.thread_profiles = []
+        self.main_profile = None
+
+    def start(self):
+        if self.kind == "pyinstrument":
+            from pyinstrument import Profiler
+            self.main_profile = Profiler()
+            self.main_profile.start()
+        else:
+            self.main_profile = cProfile.Profile()
+            self.main_profile.enable()
+
+    ##
+    # profile_thread will run a thread's body under its own cProfile, for use as a WorkerPool thread wrapper
+    #
+    # @param fn The thread body
+
+    def profile_thread(self, fn):
+        if self.kind == "pyinstrument":
+            from pyinstrument import Profiler
+            profile = Profiler()
+            with self.lock:
+                self.thread_profiles.append((threading.current_thread().name, profile))
+
+            profile.start()
+            try:
+                return fn()
+            finally:
+                profile.stop()
+
+        profile = cProfile.Profile()
+        with self.lock:
+            self.thread_profiles.append(profile)
+
+        profile.enable()
+        try:
+            return fn()
+        finally:
+            profile.disable()
+
+    ##
+    # stop will end profiling and write the report into the directory
+    #
+    # @return The path of the report
+
+    def stop(self):
+        if self.kind == "pyinstrument":
+            self.main_profile.stop()
+            path = os.path.join(self.directory, "profile.txt")
+            with open(path, "w") as report, self.lock:
+                report.write("main thread\n\n" + self.main_profile.output_text().encode("utf-8"))
+
+                for name, profile in self.thread_profiles:
+                    report.write("\n%s thread\n\n" % name + profile.output_text().encode("utf-8"))
+
+            return path
+
+        self.main_profile.disable()
+        stats = pstats.Stats(self.main_profile)
+        with self.lock:
+            for profile in self.thread_profiles:
+                try:
+                    stats.add(profile)
+                except TypeError:
+                    # a worker that never ran anything has no stats to merge
+                    pass
+
+        path = os.path.join(self.directory, "profile.pstats")
+        stats.dump_stats(path)
+        return path
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+import time
+import threading
+
+
+##
+# TokenBucket allows `rate` requests per second on average with bursts of up to `burst` requests. A rate of 0 or less
+# disables the limit. Callers sleep outside the lock so one waiting worker never stalls another's bookkeeping.
+
+class TokenBucket(object):
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst))
+        self.tokens = self.burst
+        self.last = time.time()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    ##
+    # acquire will take a token, sleeping until one is available
+    #
+    # @return The number of seconds waited
+
+    def acquire(self):
+        waited = 0.0
+
+        while True:
+            with self.lock:
+                if self.rate <= 0:
+                    return waited
+
+                self._refill(time.time())
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+
+                wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+            waited += wait
+
+    ##
+    # set_rate will change the refill rate, keeping the tokens already accrued
+    #
+    # @param rate The new rate in requests per second
+
+    def set_rate(self, rate):
+        with self.lock:
+            self._refill(time.time())
+            self.rate = float(rate)
+
+
+##
+# RateLimiter holds a token bucket per kind of request (page, detail, individual) so the expensive list pages, firm
+# details and the individuals stage each get their own budget. When adaptive, each kind's rate is cut back
+# multiplicatively whenever a window of requests sees too many failures or too much latency, and grows back
+# additively towards its configured ceiling while the host keeps up.
+
+class RateLimiter(object):
+
+    def __init__(self, budgets, burst=1, adaptive=False, latency_target=5.0, error_target=0.05, window=20,
+                 min_rate=0.1):
+        self.buckets = {}
+        self.burst = burst
+        self.ceilings = {}
+        self.windows = {}
+        self.adaptive = adaptive
+        self.latency_target = latency_target
+        self.error_target = error_target
+        self.window = window
+        self.min_rate = min_rate
+        self.lock = threading.Lock()
+
+        for kind, rate in budgets.items():
+            self.buckets[kind] = TokenBucket(rate, burst)
+            self.ceilings[kind] = float(rate)
+            self.windows[kind] = []
+
+    ##
+    # acquire will wait for the budget of a kind of request
+    #
+    # @param kind The kind of request
+    #
+    # @return The number of seconds waited
+
+    def acquire(self, kind):
+        return self.buckets[kind].acquire()
+
+    ##
+    # record will feed the outcome of a request back into the limiter, adjusting the kind's rate once a window is full
+    #
+    # @param kind The kind of request
+    # @param latency The seconds the request took
+    # @param success False if the request failed or was throttled
+    #
+    # @return The new rate if it was changed, otherwise None
+
+    def record(self, kind, latency, success):
+        bucket = self.buckets[kind]
+        if not self.adaptive or self.ceilings[kind] <= 0:
+            return None
+
+        with self.lock:
+            samples = self.windows[kind]
+            samples.append((latency, success))
+            if len(samples) < self.window:
+                return None
+
+            self.windows[kind] = []
+
+        error_rate = sum(1 for _, ok in samples if not ok) / float(len(samples))
+        mean_latency = sum(latency for latency, _ in samples) / float(len(samples))
+
+        if error_rate > self.error_target or mean_latency > self.latency_target:
+            rate = max(self.min_rate, bucket.rate * 0.5)
+        else:
+            rate = min(self.ceilings[kind], bucket.rate + self.ceilings[kind] * 0.1)
+
+        if rate == bucket.rate:
+            return None
+
+        bucket.set_rate(rate)
+        return rate
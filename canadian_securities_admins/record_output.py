@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+import json
+from licence_transformer import encode_licence
+
+
+##
+# RecordOutput is where process_page sends each scraped record. Records always go to the records dump, and with a
+# licence writer each one is also run through the licence transformer in process, straight from the fields it was
+# encoded from, into a dump of simple-licence records. The output stream is given to whichever of the two writers
+# should feed it. Checkpoints cover both dumps, so a resume cuts them back to the same firm.
+
+class RecordOutput(object):
+
+    def __init__(self, records, licences=None, keep_licences=False):
+        self.records = records
+        self.licences = licences
+        self.keep_licences = keep_licences
+
+    ##
+    # write will add a record to the dumps
+    #
+    # @param record The JSON encoded record
+    # @param fields The record's fields if they're at hand, otherwise they're decoded from the record when needed
+
+    def write(self, record, fields=None):
+        self.records.write(record)
+
+        if self.licences is not None:
+            self.licences.write(encode_licence(fields if fields is not None else json.loads(record)))
+
+    ##
+    # checkpoint will make everything written so far durable
+    #
+    # @return The position to resume from
+
+    def checkpoint(self):
+        position = self.records.checkpoint()
+        if self.licences is None:
+            return position
+
+        return {'records': position, 'licences': self.licences.checkpoint()}
+
+    ##
+    # resume will discard anything written after a checkpoint, replaying the committed records to the output stream.
+    # Licences missing from a position taken without them are transformed again from the committed records.
+    #
+    # @param position The position returned by checkpoint(), or None to discard everything
+
+    def resume(self, position):
+        licences_position = None
+        if isinstance(position, dict):
+            licences_position = position.get('licences')
+            position = position['records']
+
+        self.records.resume(position)
+
+        if self.licences is None:
+            return
+
+        self.licences.resume(licences_position)
+        if position is not None and licences_position is None:
+            for record in self.records.read():
+                self.licences.write(encode_licence(json.loads(record)))
+
+    ##
+    # remove will delete the dumps at the end of a run, keeping the licences when they're not on the output stream
+
+    def remove(self):
+        self.records.remove()
+
+        if self.licences is not None and not self.keep_licences:
+            self.licences.remove()
+
+    def close(self):
+        self.records.close()
+
+        if self.licences is not None:
+            self.licences.close()
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import gzip
+import shutil
+
+
+##
+# RecordWriter is the sink for scraped records. Each record is written as a line of JSON to the output stream and to
+# the dump in the data dir through a buffered writer. Nothing is guaranteed on disk until checkpoint() which flushes,
+# fsyncs and returns the position to resume from. With gzip compression every checkpoint closes a gzip member, so any
+# checkpointed position is a clean cut of a valid multi-member gzip file. With rotate_bytes set, a new segment is
+# started at the first checkpoint past that size. Dumps other than the scraped records are told apart by `name`.
+
+class RecordWriter(object):
+
+    def __init__(self, directory, compression=None, rotate_bytes=0, buffer_size=1024 * 1024, stream=None,
+                 name="records.dump"):
+        if compression not in (None, "gzip"):
+            raise ValueError("Unsupported record compression: %s" % compression)
+
+        self.directory = directory
+        self.name = name
+        self.compression = compression
+        self.rotate_bytes = rotate_bytes
+        self.buffer_size = buffer_size
+        self.stream = stream
+        self.segment = self._last_segment()
+        self.raw = None
+        self.frame = None
+
+    ##
+    # segment_path will give the file holding a segment of the dump
+    #
+    # @param segment The segment number, starting at 0
+    #
+    # @return The path
+
+    def segment_path(self, segment):
+        name = self.name if segment == 0 else "%s.%d" % (self.name, segment)
+        if self.compression == "gzip":
+            name += ".gz"
+
+        return os.path.join(self.directory, name)
+
+    def _last_segment(self):
+        segment = 0
+        while os.path.exists(self.segment_path(segment + 1)):
+            segment += 1
+
+        return segment
+
+    def _open(self):
+        if self.raw is None:
+            self.raw = io.open(self.segment_path(self.segment), "ab", buffering=self.buffer_size)
+
+        if self.frame is None:
+            if self.compression == "gzip":
+                self.frame = gzip.GzipFile(filename="", mode="wb", fileobj=self.raw)
+            else:
+                self.frame = self.raw
+
+    ##
+    # write will add a record to the output stream and the dump
+    #
+    # @param record The JSON encoded record
+
+    def write(self, record):
+        if isinstance(record, unicode):
+            record = record.encode("utf-8")
+
+        line = record + "\n"
+
+        if self.stream is not None:
+            self.stream.write(line)
+
+        self._open()
+        self.frame.write(line)
+
+    ##
+    # checkpoint will make everything written so far durable, rotating to a new segment if the current one is full
+    #
+    # @return The position to resume from, as a [segment, offset] list
+
+    def checkpoint(self):
+        if self.stream is not None:
+            self.stream.flush()
+
+        self._open()
+        if self.frame is not self.raw:
+            self.frame.close()
+
+        self.frame = None
+        self.raw.flush()
+        os.fsync(self.raw.fileno())
+        position = [self.segment, self.raw.tell()]
+
+        if self.rotate_bytes > 0 and position[1] >= self.rotate_bytes:
+            self.raw.close()
+            self.raw = None
+            self.segment += 1
+
+        return position
+
+    ##
+    # resume will discard anything written after a checkpoint, replaying the committed records to the output stream
+    #
+    # @param position The position returned by checkpoint(), or None to discard everything
+
+    def resume(self, position):
+        self.close()
+
+        segment, offset = position if position is not None else (0, 0)
+
+        for stale in range(segment + 1, self._last_segment() + 1):
+            os.remove(self.segment_path(stale))
+
+        if os.path.exists(self.segment_path(segment)):
+            with open(self.segment_path(segment), "r+b") as dump:
+                dump.truncate(offset)
+
+        if self.stream is not None:
+            for committed in range(0, segment + 1):
+                path = self.segment_path(committed)
+                if not os.path.exists(path):
+                    continue
+
+                with (gzip.open(path, "rb") if self.compression == "gzip" else open(path, "rb")) as dump:
+                    shutil.copyfileobj(dump, self.stream, 1024 * 1024)
+
+        # a rotation due at the checkpoint carries on in the next segment
+        self.segment = segment
+        if self.rotate_bytes > 0 and offset >= self.rotate_bytes:
+            self.segment += 1
+
+    ##
+    # read will give back the records in the dump, e.g. to merge a shard's output
+    #
+    # @return A generator of JSON encoded records, in the order they were written
+
+    def read(self):
+        self.close()
+
+        for segment in range(0, self._last_segment() + 1):
+            path = self.segment_path(segment)
+            if not os.path.exists(path):
+                continue
+
+            with (gzip.open(path, "rb") if self.compression == "gzip" else open(path, "rb")) as dump:
+                for line in dump:
+                    yield line.rstrip("\n")
+
+    ##
+    # remove will delete every segment of the dump
+
+    def remove(self):
+        self.close()
+
+        for segment in range(0, self._last_segment() + 1):
+            try:
+                os.remove(self.segment_path(segment))
+            except OSError:
+                pass
+
+        self.segment = 0
+
+    def close(self):
+        if self.frame is not None and self.frame is not self.raw:
+            self.frame.close()
+
+        if self.raw is not None:
+            self.raw.close()
+
+        self.frame = None
+        self.raw = None
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import hashlib
+import urlparse
+import threading
+import BaseHTTPServer
+import SocketServer
+from requests.adapters import HTTPAdapter
+
+
+##
+# fixture_key will identify a postback independent of when it was made. The event target alone is ambiguous (every
+# firm has a lbtnShowFirmHistorical) but together with the view state it's posted from it pins down one response, and
+# since replayed responses hand back the recorded view states the keys line up on replay regardless of request order.
+#
+# @param method The HTTP method
+# @param body The url encoded form body
+#
+# @return A tuple of the event target and the fixture's file name
+
+def fixture_key(method, body):
+    if method == "GET" or not body:
+        return "GET", hashlib.sha1("GET").hexdigest()
+
+    fields = urlparse.parse_qs(body, keep_blank_values=True)
+    target = fields.get("__EVENTTARGET", [""])[0] or "(submit)"
+    view_state = fields.get("__VIEWSTATE", [""])[0]
+
+    return target, hashlib.sha1(target + "\0" + view_state).hexdigest()
+
+
+##
+# RecordingAdapter is a requests transport adapter that saves every request/response pair it sends into a fixture
+# directory, one json file per fixture_key
+
+class RecordingAdapter(HTTPAdapter):
+
+    def __init__(self, directory, **kwargs):
+        HTTPAdapter.__init__(self, **kwargs)
+        self.directory = directory
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def send(self, request, **kwargs):
+        response = HTTPAdapter.send(self, request, **kwargs)
+
+        body = request.body or ""
+        if isinstance(body, unicode):
+            body = body.encode("utf-8")
+
+        target, name = fixture_key(request.method, body)
+        fixture = {'target': target,
+                   'method': request.method,
+                   'url': request.url,
+                   'status': response.status_code,
+                   'content_type': response.headers.get("Content-Type", "text/plain; charset=utf-8"),
+                   'body': response.content.decode(response.encoding or "utf-8")}
+
+        with open(os.path.join(self.directory, name + ".json"), "w") as fixture_file:
+            json.dump(fixture, fixture_file)
+
+        return response
+
+
+##
+# record_session will capture everything a session sends into a fixture directory
+#
+# @param session The requests session
+# @param directory The fixture directory
+# @param kwargs Passed on to the HTTPAdapter, e.g. pool_maxsize
+
+def record_session(session, directory, **kwargs):
+    adapter = RecordingAdapter(directory, **kwargs)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+
+##
+# ReplayHandler answers requests from the fixture directory of its server, 404ing anything that wasn't recorded
+
+class ReplayHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def _replay(self, body):
+        target, name = fixture_key(self.command, body)
+        path = os.path.join(self.server.directory, name + ".json")
+
+        with self.server.lock:
+            self.server.hits[target.rstrip("0123456789")] = self.server.hits.get(target.rstrip("0123456789"), 0) + 1
+
+        if not os.path.exists(path):
+            self.send_error(404, "No fixture recorded for %s" % target)
+            return
+
+        with open(path, "r") as fixture_file:
+            fixture = json.load(fixture_file)
+
+        content = fixture['body'].encode("utf-8")
+        self.send_response(fixture['status'])
+        self.send_header("Content-Type", fixture['content_type'])
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):
+        self._replay("")
+
+    def do_POST(self):
+        self._replay(self.rfile.read(int(self.headers.getheader("Content-Length", 0))))
+
+    def log_message(self, format, *args):
+        pass
+
+
+##
+# ReplayServer is a local stand-in for the NRS site serving recorded fixtures. It counts the requests it answers by
+# event target, with trailing page/row numbers dropped so e.g. every lbtnPager counts together.
+
+class ReplayServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, directory, port=0):
+        BaseHTTPServer.HTTPServer.__init__(self, ("127.0.0.1", port), ReplayHandler)
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.hits = {}
+
+    ##
+    # url will give the search url to point the scraper at
+    #
+    # @return The url
+
+    def url(self):
+        return "http://127.0.0.1:%d/nrs/nrsearchResult.aspx?ID=1325" % self.server_address[1]
+
+    ##
+    # start will serve in a background thread
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, name="replay-server")
+        thread.daemon = True
+        thread.start()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print "usage: python replay.py <fixture directory> [port]"
+        sys.exit(1)
+
+    server = ReplayServer(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 8000)
+    print "Replaying %s on %s" % (sys.argv[1], server.url())
+    server.serve_forever()
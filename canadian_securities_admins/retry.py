@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+
+import time
+import random
+import threading
+import email.utils
+
+
+##
+# RequestFailed is raised when a request could not be completed, either because retries were exhausted or because the
+# failure isn't worth retrying
+
+class RequestFailed(Exception):
+
+    def __init__(self, message, response=None):
+        Exception.__init__(self, message)
+        self.response = response
+
+
+##
+# FatalRequestError is raised for responses that retrying won't fix (e.g. 404, 400)
+
+class FatalRequestError(RequestFailed):
+    pass
+
+
+##
+# RetryPolicy decides whether a failed request is retried and for how long to wait. Delays use decorrelated jitter:
+# each one is drawn uniformly between the base delay and three times the previous delay, capped at max_delay, so
+# concurrent workers that fail together don't retry together. A Retry-After header from the server always wins.
+# Requests that never got a response are retried if they failed to connect, timed out or were cut off mid-transfer,
+# anything else (e.g. an invalid url) won't go any better the next time.
+
+class RetryPolicy(object):
+
+    def __init__(self, max_attempts=6, base_delay=1.0, max_delay=60.0,
+                 retryable_statuses=(408, 429, 500, 502, 503, 504), retryable_errors=None):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retryable_statuses = frozenset(retryable_statuses)
+        self.retryable_errors = retryable_errors
+
+    ##
+    # is_retryable_status will determine if a response status is transient
+    #
+    # @param status_code The HTTP status of the response
+    #
+    # @return True if the request should be tried again
+
+    def is_retryable_status(self, status_code):
+        return status_code in self.retryable_statuses
+
+    ##
+    # is_retryable_error will determine if a failure to get a response is transient
+    #
+    # @param error The exception raised by the transport
+    #
+    # @return True if the request should be tried again
+
+    def is_retryable_error(self, error):
+        if self.retryable_errors is None:
+            # requests is only imported once something has been sent
+            import requests
+            self.retryable_errors = (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                                     requests.exceptions.ChunkedEncodingError)
+
+        return isinstance(error, self.retryable_errors)
+
+    ##
+    # next_delay will compute how long to wait before the next attempt
+    #
+    # @param previous_delay The delay used before the previous attempt
+    # @param response The failed response, or None on a connection failure
+    #
+    # @return The delay in seconds
+
+    def next_delay(self, previous_delay, response=None):
+        retry_after = get_retry_after(response)
+        if retry_after is not None:
+            return min(self.max_delay, retry_after)
+
+        return min(self.max_delay, random.uniform(self.base_delay, max(self.base_delay, previous_delay) * 3))
+
+
+##
+# get_retry_after will read the Retry-After header of a response, which is either a number of seconds or a HTTP date
+#
+# @param response The response, or None
+#
+# @return The number of seconds to wait or None if the server didn't say
+
+def get_retry_after(response):
+    if response is None:
+        return None
+
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+
+    parsed = email.utils.parsedate_tz(value)
+    if parsed is None:
+        return None
+
+    return max(0.0, email.utils.mktime_tz(parsed) - time.time())
+
+
+##
+# CircuitBreaker is shared by every worker. Once failure_threshold consecutive requests have failed the circuit opens
+# and all workers hold off new requests for reset_timeout seconds, after which traffic resumes. Waiting is done
+# outside the lock so a worker sleeping on the breaker never holds up another worker's in-flight request.
+
+class CircuitBreaker(object):
+
+    def __init__(self, failure_threshold=10, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.lock = threading.Lock()
+
+    ##
+    # wait_until_closed will sleep the calling worker while the circuit is open
+    #
+    # @return The number of seconds waited
+
+    def wait_until_closed(self):
+        waited = 0.0
+
+        while True:
+            with self.lock:
+                remaining = self.open_until - time.time()
+
+            if remaining <= 0:
+                return waited
+
+            time.sleep(remaining)
+            waited += remaining
+
+    ##
+    # record_success will close the circuit after a request succeeds
+
+    def record_success(self):
+        with self.lock:
+            self.consecutive_failures = 0
+
+    ##
+    # record_failure will count a failed request, opening the circuit once the threshold is hit
+    #
+    # @return True if this failure opened the circuit
+
+    def record_failure(self):
+        with self.lock:
+            self.consecutive_failures += 1
+
+            if self.consecutive_failures < self.failure_threshold:
+                return False
+
+            self.consecutive_failures = 0
+            self.open_until = time.time() + self.reset_timeout
+            return True
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import shutil
+import subprocess
+
+
+# exit status of a shard worker that saw the reported record count move away from the coordinator's
+DATASET_CHANGED_EXIT = 3
+
+
+##
+# DatasetChanged is raised inside a shard worker when a result page reports a different number of records than the
+# coordinator planned the shards around
+
+class DatasetChanged(Exception):
+    pass
+
+
+##
+# plan_shards will split the result pages into contiguous ranges of roughly equal size
+#
+# @param record_count The number of records reported by the search
+# @param rows_per_page The number of rows on a result page
+# @param shard_count The number of shards wanted
+#
+# @return A list of (first page, last page) tuples, in page order
+
+def plan_shards(record_count, rows_per_page, shard_count):
+    pages = max(1, (record_count + rows_per_page - 1) // rows_per_page)
+    shard_count = max(1, min(shard_count, pages))
+
+    plans = []
+    first_page = 1
+    for shard in range(shard_count):
+        size = pages // shard_count + (1 if shard < pages % shard_count else 0)
+        plans.append((first_page, first_page + size - 1))
+        first_page += size
+
+    return plans
+
+
+##
+# share_budgets will split the request budgets between the shard workers, so all of them together send the single host
+# no more than one process would. A rate of 0 stays unlimited.
+#
+# @param budgets The rate in requests per second of each kind of request, by kind
+# @param burst The requests of each kind allowed back to back
+# @param shard_count The number of shard workers
+#
+# @return The CSA_RATE_* settings of each worker
+
+def share_budgets(budgets, burst, shard_count):
+    settings = {"CSA_RATE_BURST": str(max(1, int(burst) // shard_count))}
+    for kind, rate in budgets.items():
+        settings["CSA_RATE_" + kind.upper()] = repr(rate / shard_count if rate > 0 else 0.0)
+
+    return settings
+
+
+##
+# shard_dir will give the directory a shard keeps its records, journal and caches in
+#
+# @param data_dir The coordinator's data dir
+# @param shard The shard number, starting at 0
+#
+# @return The path
+
+def shard_dir(data_dir, shard):
+    return os.path.join(data_dir, "shard-%d" % shard)
+
+
+##
+# ShardRun is a set of worker processes crawling one shard each. Workers are the scraper itself, run with the
+# CSA_SHARD_* variables naming their page range, directory, page size and the record count every page must still
+# report, plus any `settings` overriding the coordinator's environment, e.g. their share of the request budgets.
+# Nothing else is shared with the coordinator, so a worker can just as well be started on another node that sees the
+# same data dir.
+
+class ShardRun(object):
+
+    def __init__(self, script, data_dir, record_count, rows_per_page, plans, settings=None):
+        self.script = script
+        self.settings = settings or {}
+        self.data_dir = data_dir
+        self.record_count = record_count
+        self.rows_per_page = rows_per_page
+        self.plans = plans
+        self.processes = []
+
+    ##
+    # start will spawn a worker process per shard
+
+    def start(self):
+        for shard, (first_page, last_page) in enumerate(self.plans):
+            directory = shard_dir(self.data_dir, shard)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+
+            env = dict(os.environ)
+            env.update(self.settings)
+            env["CSA_SHARD_PAGES"] = "%d:%d" % (first_page, last_page)
+            env["CSA_SHARD_DIR"] = directory
+            env["CSA_SHARD_RECORD_COUNT"] = str(self.record_count)
+            env["CSA_SHARD_ROWS_PER_PAGE"] = str(self.rows_per_page)
+
+            self.processes.append(subprocess.Popen([sys.executable, self.script], env=env,
+                                                   cwd=os.path.dirname(os.path.abspath(self.script))))
+
+    ##
+    # wait will block until every worker has exited
+    #
+    # @return The list of shards that failed, and whether any of them saw the data set change
+
+    def wait(self):
+        failed = []
+        changed = False
+
+        for shard, process in enumerate(self.processes):
+            status = process.wait()
+            if status == DATASET_CHANGED_EXIT:
+                changed = True
+
+            if status != 0 or not os.path.exists(self.done_path(shard)):
+                failed.append(shard)
+
+        return failed, changed
+
+    ##
+    # done_path will give the marker a worker leaves once its whole page range is written
+    #
+    # @param shard The shard number
+    #
+    # @return The path
+
+    def done_path(self, shard):
+        return os.path.join(shard_dir(self.data_dir, shard), "shard.done")
+
+    ##
+    # merge will write every shard's records to a RecordWriter, in page order
+    #
+    # @param record_writer The coordinator's RecordWriter
+    # @param reader A callable giving a RecordWriter over a shard directory
+    #
+    # @return The number of records merged
+
+    def merge(self, record_writer, reader):
+        merged = 0
+
+        for shard in range(len(self.plans)):
+            for record in reader(shard_dir(self.data_dir, shard)).read():
+                record_writer.write(record)
+                merged += 1
+
+            record_writer.checkpoint()
+
+        return merged
+
+    ##
+    # remove will delete every shard directory
+    #
+    # @param keep Names of files to keep in each shard directory, e.g. caches meant to outlive the run
+
+    def remove(self, keep=()):
+        for shard in range(len(self.plans)):
+            directory = shard_dir(self.data_dir, shard)
+            if not os.path.isdir(directory):
+                continue
+
+            for name in os.listdir(directory):
+                if name in keep:
+                    continue
+
+                path = os.path.join(directory, name)
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+
+
+##
+# mark_done will record that a worker wrote its whole page range
+#
+# @param directory The shard directory
+# @param first_page The first page of the shard
+# @param last_page The last page of the shard
+
+def mark_done(directory, first_page, last_page):
+    with open(os.path.join(directory, "shard.done"), "w") as done:
+        done.write(json.dumps({'pages': [first_page, last_page]}))
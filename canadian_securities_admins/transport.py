@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+import re
+
+
+placeholder_regex = re.compile(r'\[([A-Z_]+)\]')
+
+
+##
+# BodyTemplate is a url encoded post body with [PLACEHOLDER] fields. The template is split once into its literal
+# segments and the slots between them, so rendering a body is a single join instead of a str.replace pass over the
+# whole multi-KB body for each field.
+
+class BodyTemplate(object):
+
+    def __init__(self, text):
+        self.parts = placeholder_regex.split(text)
+        self.slots = [(index, self.parts[index]) for index in range(1, len(self.parts), 2)]
+
+    ##
+    # render will fill in the placeholders
+    #
+    # @param values The value of each placeholder by name, already url encoded
+    #
+    # @return A data string
+
+    def render(self, values):
+        parts = list(self.parts)
+        for index, name in self.slots:
+            parts[index] = values[name]
+
+        return "".join(parts)
+
+
+##
+# Transport sends the crawl's requests over one keep-alive connection pool sized for every worker thread, so
+# concurrent workers reuse connections instead of queueing on (or discarding) the default pool of 10. Responses are
+# asked for gzip or deflate encoded and decoded transparently, and the headers are built once up front. Every request
+# gives up after `timeout`, a (connect, read) tuple in seconds, so a stalled connection fails like any other instead of
+# holding its worker forever. `errors` is the exception raised when a request can't be made and `ok` the status code of
+# a successful response.
+
+class Transport(object):
+
+    headers = {"X-MicrosoftAjax": "Delta=true",
+               "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
+               "Accept": "*/*",
+               "Accept-Encoding": "gzip, deflate",
+               "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_10_1) AppleWebKit/537.36 "
+                             "(KHTML, like Gecko) Chrome/39.0.2171.71 Safari/537.36",
+               "Cache-Control": "no-cache",
+               "Pragma": "no-cache"}
+
+    def __init__(self, pool_size, timeout):
+        # requests is only imported once something is going to be sent
+        import requests
+        from requests.adapters import HTTPAdapter
+        from requests.structures import CaseInsensitiveDict
+
+        self.requests = requests
+        self.errors = requests.exceptions.RequestException
+        self.ok = requests.codes.ok
+        self.prepared_headers = CaseInsensitiveDict(self.headers)
+        self.pool_size = max(1, pool_size)
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.mount(HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size))
+
+    ##
+    # mount will route every request through an adapter, e.g. one that records fixtures
+    #
+    # @param adapter The requests transport adapter
+
+    def mount(self, adapter):
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    ##
+    # send will make a single attempt at a request
+    #
+    # @param method The HTTP method
+    # @param url The web address
+    # @param data The payload
+    #
+    # @return The response, raising one of `errors` if the host couldn't be reached or didn't answer in time
+
+    def send(self, method, url, data):
+        prepared = self.requests.PreparedRequest()
+        prepared.prepare(method=method, url=url, headers=self.prepared_headers, data=data)
+        return self.session.send(prepared, timeout=self.timeout)
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import threading
+import itertools
+import Queue
+
+
+##
+# Job is a handle on a unit of work submitted to a WorkerPool. The result (or the exception raised while running it) is
+# held until the submitter asks for it, which lets callers dispatch work out of order but consume it in order.
+
+class Job(object):
+
+    def __init__(self, fn, args):
+        self.fn = fn
+        self.args = args
+        self._done = threading.Event()
+        self._result = None
+        self._exc_info = None
+
+    ##
+    # run executes the job on the calling thread, capturing its outcome
+
+    def run(self):
+        try:
+            self._result = self.fn(*self.args)
+        except Exception:
+            self._exc_info = sys.exc_info()
+
+        self._done.set()
+
+    ##
+    # result blocks until the job has run
+    #
+    # @return The value returned by the job, re-raising anything it raised
+
+    def result(self):
+        # wait in short slices so the main thread stays responsive to interrupts
+        while not self._done.wait(0.5):
+            pass
+
+        if self._exc_info is not None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+
+        return self._result
+
+
+##
+# WorkerPool is a fixed size set of daemon threads consuming jobs from a shared queue.
+# A pool of size 0 or 1 still runs on its own thread so callers behave the same regardless of the configured limit.
+# A thread_wrapper, if given, is called with each thread's body and must run it (e.g. to profile the thread).
+# Jobs submitted with a higher priority are started first, equal priorities start in the order they were submitted.
+
+class WorkerPool(object):
+
+    def __init__(self, size, name="worker", thread_wrapper=None):
+        self.size = max(1, size)
+        self.queue = Queue.PriorityQueue()
+        self.sequence = itertools.count()
+        self.threads = []
+
+        target = self._work
+        if thread_wrapper is not None:
+            target = lambda: thread_wrapper(self._work)
+
+        for i in range(self.size):
+            thread = threading.Thread(target=target, name="%s-%d" % (name, i))
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def _work(self):
+        while True:
+            _, _, job = self.queue.get()
+            if job is None:
+                break
+
+            job.run()
+
+    ##
+    # submit queues a callable for execution
+    #
+    # @param fn The callable
+    # @param args The positional arguments to call it with
+    #
+    # @return A Job handle
+
+    def submit(self, fn, *args):
+        return self.submit_with_priority(0, fn, *args)
+
+    ##
+    # submit_with_priority queues a callable ahead of anything queued with a lower priority, e.g. the estimated cost of
+    # the job so the longest jobs start first
+    #
+    # @param priority The priority of the job
+    # @param fn The callable
+    # @param args The positional arguments to call it with
+    #
+    # @return A Job handle
+
+    def submit_with_priority(self, priority, fn, *args):
+        job = Job(fn, args)
+        self.queue.put((-priority, next(self.sequence), job))
+        return job
+
+    ##
+    # shutdown lets queued jobs drain then stops the worker threads
+
+    def shutdown(self):
+        # stop markers sort after every job, so the queue drains first
+        for _ in self.threads:
+            self.queue.put((float("inf"), next(self.sequence), None))
+
+        for thread in self.threads:
+            thread.join()
+
+
+##
+# Coalescer shares one execution of a keyed piece of work between concurrent callers. The first caller for a key runs
+# it on its own thread; anyone asking for the same key while it's in flight waits for that result instead of repeating
+# the work. Once finished the key is forgotten, so callers are expected to cache the outcome themselves.
+
+class Coalescer(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = {}
+
+    ##
+    # run will execute fn for a key unless that key is already in flight
+    #
+    # @param key The identity of the work
+    # @param fn The callable
+    # @param args The positional arguments to call it with
+    #
+    # @return A tuple of the result and whether it was shared from another caller
+
+    def run(self, key, fn, *args):
+        with self.lock:
+            job = self.in_flight.get(key)
+            leader = job is None
+            if leader:
+                job = self.in_flight[key] = Job(fn, args)
+
+        if not leader:
+            return job.result(), True
+
+        try:
+            job.run()
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+
+        return job.result(), False
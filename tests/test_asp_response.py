@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import unittest
+
+test_directory = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(test_directory, "..", "canadian_securities_admins"))
+
+from asp_response import AspResponse
+
+
+def frame(frame_type, frame_id, content):
+    return "%d|%s|%s|%s|" % (len(content), frame_type, frame_id, content)
+
+
+def delta(panel):
+    return (frame("updatePanel", "ctl00_bodyContent_upSearch", panel) +
+            frame("hiddenField", "__VIEWSTATE", "/wEPDw|UKMTM=") +
+            frame("hiddenField", "__EVENTVALIDATION", "/wEWAgK+") +
+            frame("hiddenField", "__VIEWSTATEGENERATOR", "A1B2C3D4") +
+            frame("pageRedirect", "", "") +
+            frame("asyncPostBackControlIDs", "", "ctl00$bodyContent$btnSearch"))
+
+
+class DeltaFramesTest(unittest.TestCase):
+
+    def test_splits_panels_and_hidden_fields(self):
+        panel = '<div>There are 1234 records found</div><table class="gridview_style"><tr><td>|</td></tr></table>'
+        response = AspResponse(delta(panel))
+
+        self.assertEqual(response.html, panel)
+        self.assertEqual(response.record_count, 1234)
+        self.assertEqual(response.hidden_field("__VIEWSTATE"), "/wEPDw|UKMTM=")
+        self.assertEqual(response.hidden_field("__VIEWSTATEGENERATOR"), "A1B2C3D4")
+        self.assertEqual(response.hidden_field("__EVENTTARGET"), None)
+        self.assertEqual(response.view_state, {'view': "/wEPDw%7CUKMTM%3D",
+                                               'validation': "/wEWAgK%2B",
+                                               'generator': "A1B2C3D4"})
+
+    def test_joins_every_update_panel(self):
+        response = AspResponse(frame("updatePanel", "first", "<p>one</p>") +
+                               frame("updatePanel", "second", "<p>two</p>"))
+
+        self.assertEqual(response.html, "<p>one</p><p>two</p>")
+
+    def test_counts_multibyte_content_in_characters(self):
+        panel = u"<td>Société Générale</td>"
+        response = AspResponse(frame("updatePanel", "panel", panel) + frame("hiddenField", "__VIEWSTATE", "v"))
+
+        self.assertEqual(response.html, panel)
+        self.assertEqual(response.hidden_field("__VIEWSTATE"), "v")
+
+    def test_length_mismatch_falls_back_to_scanning_the_text(self):
+        text = delta("<div>There are 7 records found</div>").replace("36|updatePanel", "40|updatePanel")
+        response = AspResponse(text)
+
+        self.assertEqual(response.html, text)
+        self.assertEqual(response.record_count, 7)
+        self.assertEqual(response.hidden_field("__VIEWSTATEGENERATOR"), "A1B2C3D4")
+
+    def test_truncated_response_falls_back_to_scanning_the_text(self):
+        text = delta("<div>There are 7 records found</div>")[:-20]
+        response = AspResponse(text)
+
+        self.assertEqual(response.html, text)
+        self.assertEqual(response.hidden_field("__EVENTVALIDATION"), "/wEWAgK+")
+
+    def test_error_page_has_no_hidden_fields(self):
+        response = AspResponse("<html><body>Server Error in '/' Application.</body></html>")
+
+        self.assertEqual(response.hidden_field("__VIEWSTATE"), None)
+        self.assertEqual(response.record_count, None)
+        self.assertIn("Server Error", response.html)
+
+
+if __name__ == "__main__":
+    unittest.main()
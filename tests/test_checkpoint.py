@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+test_directory = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(test_directory, "..", "canadian_securities_admins"))
+
+from checkpoint import CheckpointJournal
+
+
+class CheckpointJournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "checkpoint.journal")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_new_journal_has_no_progress(self):
+        journal = CheckpointJournal(self.path)
+
+        self.assertEqual(journal.last_page(), None)
+        self.assertEqual(journal.committed_position(), None)
+        self.assertEqual(journal.completed_firms(1), 0)
+        journal.close()
+
+    def test_replays_the_last_completed_firm(self):
+        journal = CheckpointJournal(self.path)
+        journal.firm_done(3, 0, [0, 100])
+        journal.firm_done(3, 1, [0, 250])
+        journal.close()
+
+        resumed = CheckpointJournal(self.path)
+        self.assertEqual(resumed.last_page(), 3)
+        self.assertEqual(resumed.completed_firms(3), 2)
+        self.assertEqual(resumed.completed_firms(4), 0)
+        self.assertEqual(resumed.committed_position(), [0, 250])
+        resumed.close()
+
+    def test_torn_final_line_is_ignored(self):
+        journal = CheckpointJournal(self.path)
+        journal.firm_done(2, 4, [1, 80])
+        journal.close()
+
+        with open(self.path, "a") as torn:
+            torn.write('{"page": 2, "firm": 5, "posi')
+
+        resumed = CheckpointJournal(self.path)
+        self.assertEqual(resumed.completed_firms(2), 5)
+        self.assertEqual(resumed.committed_position(), [1, 80])
+        resumed.close()
+
+    def test_rosters_sharing_a_jurisdiction_are_kept_apart(self):
+        journal = CheckpointJournal(self.path)
+        journal.roster_page_done(u"Acme Capital", 1, u"Ontario", 1)
+        journal.roster_page_done(u"Acme Capital", 1, u"Ontario", 2)
+        journal.close()
+
+        resumed = CheckpointJournal(self.path)
+        self.assertEqual(resumed.walked_roster_pages(u"Acme Capital", 1, u"Ontario"), 2)
+        self.assertEqual(resumed.walked_roster_pages(u"Acme Capital", 3, u"Ontario"), 0)
+        self.assertEqual(resumed.walked_roster_pages(u"Acme Capital", 1, u"Quebec"), 0)
+        resumed.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+bot_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "canadian_securities_admins")
+sys.path.insert(0, bot_directory)
+
+from export import Export
+from firm_model import Firm, Location, Category, Individual, encode_individuals, encode_record
+
+
+def location(jurisdiction, categories, individuals=None):
+    registration = Location(jurisdiction)
+    registration.contact = u"1 King St W, Toronto"
+    registration.categories = [Category(category) for category in categories]
+    if individuals is not None:
+        registration.individuals = [Individual(name, jurisdiction) for name in individuals]
+    return registration
+
+
+def encode_location_individuals(position, registration):
+    return encode_individuals([dict(zip(("jurisdiction", "name", "firm", "terms", "contact", "categories"),
+                                        individual.row()))
+                               for individual in registration.individuals])
+
+
+class ExportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def export(self, firm):
+        records = [encode_record(fields, individuals)
+                   for fields, individuals in firm.flatten(encode_location_individuals)]
+        counts = Export(self.directory, ["sqlite"], batch_size=2).write(records)
+        return counts, sqlite3.connect(os.path.join(self.directory, "export.db"))
+
+    def test_same_jurisdiction_locations_stay_apart(self):
+        firm = Firm(u"Acme Capital")
+        firm.all_jurisdictions = u"Ontario"
+        firm.locations = [location(u"Ontario", [u"Portfolio Manager", u"Exempt Market Dealer"], [u"Jane Roe"]),
+                          location(u"Ontario", [u"Portfolio Manager"], [u"John Doe", u"Max Mustermann"])]
+
+        counts, db = self.export(firm)
+
+        self.assertEqual(counts['firms'], 1)
+        self.assertEqual(counts['locations'], 2)
+        self.assertEqual(counts['categories'], 3)
+        self.assertEqual(counts['individuals'], 3)
+
+        rows = db.execute("SELECT locations.id, categories.category FROM locations "
+                          "JOIN categories ON categories.location_id = locations.id ORDER BY categories.rowid")
+        self.assertEqual([category for _, category in rows],
+                         [u"Portfolio Manager", u"Exempt Market Dealer", u"Portfolio Manager"])
+
+        rosters = db.execute("SELECT location_id, name FROM individuals ORDER BY id").fetchall()
+        self.assertEqual(rosters, [(1, u"Jane Roe"), (2, u"John Doe"), (2, u"Max Mustermann")])
+
+    def test_locations_without_rosters_stay_apart(self):
+        firm = Firm(u"Acme Capital")
+        firm.locations = [location(u"Ontario", [u"Portfolio Manager"]),
+                          location(u"Ontario", [u"Exempt Market Dealer", u"Investment Fund Manager"])]
+
+        counts, db = self.export(firm)
+
+        self.assertEqual(counts['locations'], 2)
+        self.assertEqual(counts['categories'], 3)
+        self.assertEqual(counts['individuals'], 0)
+
+        rows = db.execute("SELECT location_id, category FROM categories ORDER BY rowid").fetchall()
+        self.assertEqual(rows, [(1, u"Portfolio Manager"), (2, u"Exempt Market Dealer"),
+                                (2, u"Investment Fund Manager")])
+
+    def test_roster_is_stored_once_per_location(self):
+        firm = Firm(u"Acme Capital")
+        firm.locations = [location(u"Quebec", [u"Portfolio Manager", u"Investment Fund Manager"], [u"Jane Roe"])]
+
+        counts, db = self.export(firm)
+
+        self.assertEqual(counts['locations'], 1)
+        self.assertEqual(counts['categories'], 2)
+        self.assertEqual(counts['individuals'], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import unittest
+
+test_directory = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(test_directory, "..", "canadian_securities_admins"))
+
+from asp_response import get_registrations_markup
+from history_cache import panel_digest
+
+
+def details(registrations, footer):
+    return ('<div id="ctl00_bodyContent_divSearchResults">%s<div class="footer">%s</div></div>'
+            '<a id="ctl00_bodyContent_lbtnShowFirmHistorical">History</a>' % (registrations, footer))
+
+
+class RegistrationsDigestTest(unittest.TestCase):
+
+    def setUp(self):
+        with open(os.path.join(test_directory, "fixtures", "history", "firm_revoked_categories.html"), "r") as panel:
+            self.panel = panel.read()
+
+    def test_cuts_the_whole_registrations_table(self):
+        registrations = get_registrations_markup(self.panel)
+
+        self.assertTrue(registrations.startswith('<table id="ctl00_bodyContent_dlstFirmLocations">'))
+        self.assertTrue(registrations.endswith("</table>"))
+        self.assertEqual(registrations.count("<table"), registrations.count("</table>"))
+        self.assertIn("British Columbia", registrations)
+
+    def test_digest_ignores_markup_around_the_registrations(self):
+        registrations = get_registrations_markup(self.panel)
+        first = get_registrations_markup(details(registrations, "Generated 10:01"))
+        second = get_registrations_markup(details(registrations, "Generated 10:02"))
+
+        self.assertEqual(panel_digest(first), panel_digest(second))
+        self.assertNotEqual(panel_digest(first),
+                            panel_digest(get_registrations_markup(details(registrations.replace("Active", "Revoked"),
+                                                                          "Generated 10:01"))))
+
+    def test_no_registrations_table(self):
+        self.assertEqual(get_registrations_markup(details("", "")), None)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import glob
+import unittest
+
+test_directory = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(test_directory, "..", "canadian_securities_admins"))
+sys.path.insert(0, os.path.join(test_directory, "..", "benchmarks"))
+
+from asp_response import repair_history
+from history_repair_benchmark import legacy_repair_firm, legacy_repair_individual
+
+
+# History panels in the markup the NRS form sends, one file per case, named firm_* or individual_* by the postback
+fixture_directory = os.path.join(test_directory, "fixtures", "history")
+
+
+class HistoryRepairTest(unittest.TestCase):
+
+    def fixtures(self):
+        paths = sorted(glob.glob(os.path.join(fixture_directory, "*.html")))
+        self.assertTrue(len(paths) > 0)
+
+        for path in paths:
+            with open(path, "r") as fixture_file:
+                yield os.path.basename(path), fixture_file.read()
+
+    def test_matches_legacy_repair(self):
+        for name, markup in self.fixtures():
+            legacy = legacy_repair_firm if name.startswith("firm_") else legacy_repair_individual
+            self.assertEqual(repair_history(markup), legacy(markup), name)
+
+    def test_removes_revocation_panels(self):
+        for name, markup in self.fixtures():
+            repaired = repair_history(markup)
+            self.assertNotIn("pnlRevocationDate", repaired, name)
+            self.assertEqual(repaired == markup, "pnlRevocationDate" not in markup, name)
+
+
+if __name__ == "__main__":
+    unittest.main()
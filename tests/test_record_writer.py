@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import sys
+import gzip
+import shutil
+import tempfile
+import unittest
+
+test_directory = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(test_directory, "..", "canadian_securities_admins"))
+
+from record_writer import RecordWriter
+
+
+class RecordWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_resume_truncates_to_the_checkpoint(self):
+        writer = RecordWriter(self.directory)
+        writer.write('{"firm": "A"}')
+        position = writer.checkpoint()
+        writer.write('{"firm": "B"}')
+        writer.checkpoint()
+        writer.write('{"firm": "C"}')
+        writer.close()
+
+        stream = io.BytesIO()
+        resumed = RecordWriter(self.directory, stream=stream)
+        resumed.resume(position)
+
+        self.assertEqual(stream.getvalue(), '{"firm": "A"}\n')
+
+        resumed.write('{"firm": "D"}')
+        resumed.checkpoint()
+        self.assertEqual(list(resumed.read()), ['{"firm": "A"}', '{"firm": "D"}'])
+
+    def test_resume_without_a_checkpoint_starts_over(self):
+        writer = RecordWriter(self.directory)
+        writer.write('{"firm": "A"}')
+        writer.checkpoint()
+        writer.close()
+
+        resumed = RecordWriter(self.directory)
+        resumed.resume(None)
+
+        self.assertEqual(list(resumed.read()), [])
+
+    def test_gzip_resume_cuts_between_members(self):
+        writer = RecordWriter(self.directory, compression="gzip")
+        writer.write(u'{"firm": "Société Générale"}')
+        position = writer.checkpoint()
+        writer.write('{"firm": "B"}')
+        writer.close()
+
+        resumed = RecordWriter(self.directory, compression="gzip")
+        resumed.resume(position)
+        resumed.write('{"firm": "C"}')
+        resumed.checkpoint()
+        resumed.close()
+
+        with gzip.open(resumed.segment_path(0), "rb") as dump:
+            self.assertEqual(dump.read(), u'{"firm": "Société Générale"}\n{"firm": "C"}\n'.encode("utf-8"))
+
+    def test_rotates_at_the_first_checkpoint_past_the_size(self):
+        writer = RecordWriter(self.directory, rotate_bytes=20)
+        positions = []
+        for firm in "ABCD":
+            writer.write('{"firm": "%s"}' % firm)
+            positions.append(writer.checkpoint())
+        writer.close()
+
+        self.assertEqual(positions, [[0, 14], [0, 28], [1, 14], [1, 28]])
+        self.assertTrue(os.path.exists(writer.segment_path(1)))
+        self.assertFalse(os.path.exists(writer.segment_path(2)))
+        self.assertEqual(list(writer.read()), ['{"firm": "%s"}' % firm for firm in "ABCD"])
+
+    def test_resume_drops_later_segments_and_replays_earlier_ones(self):
+        writer = RecordWriter(self.directory, rotate_bytes=20)
+        positions = []
+        for firm in "ABCDE":
+            writer.write('{"firm": "%s"}' % firm)
+            positions.append(writer.checkpoint())
+        writer.close()
+
+        stream = io.BytesIO()
+        resumed = RecordWriter(self.directory, rotate_bytes=20, stream=stream)
+        resumed.resume(positions[2])
+
+        self.assertFalse(os.path.exists(resumed.segment_path(2)))
+        self.assertEqual(stream.getvalue(), "".join(['{"firm": "%s"}\n' % firm for firm in "ABC"]))
+
+        resumed.write('{"firm": "F"}')
+        self.assertEqual(resumed.checkpoint(), [1, 28])
+
+    def test_resume_at_a_full_segment_carries_on_in_the_next(self):
+        writer = RecordWriter(self.directory, rotate_bytes=20)
+        writer.write('{"firm": "A"}')
+        writer.checkpoint()
+        writer.write('{"firm": "B"}')
+        position = writer.checkpoint()
+        writer.close()
+
+        resumed = RecordWriter(self.directory, rotate_bytes=20)
+        resumed.resume(position)
+        resumed.write('{"firm": "C"}')
+
+        self.assertEqual(resumed.checkpoint(), [1, 14])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import threading
+import unittest
+
+test_directory = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(test_directory, "..", "canadian_securities_admins"))
+
+from workers import WorkerPool
+
+
+class WorkerPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = WorkerPool(1)
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def hold(self):
+        # occupy the pool's only worker so everything submitted after it queues up
+        started = threading.Event()
+        release = threading.Event()
+        self.pool.submit(lambda: started.set() or release.wait())
+        started.wait()
+        return release
+
+    def test_starts_the_highest_priority_first(self):
+        release = self.hold()
+        order = []
+        jobs = [self.pool.submit_with_priority(priority, order.append, name)
+                for priority, name in [(2, "small"), (40, "big"), (0, "unknown"), (12, "medium")]]
+        release.set()
+
+        for job in jobs:
+            job.result()
+
+        self.assertEqual(order, ["big", "medium", "small", "unknown"])
+
+    def test_equal_priorities_start_in_submission_order(self):
+        release = self.hold()
+        order = []
+        jobs = [self.pool.submit_with_priority(5, order.append, index) for index in range(10)]
+        release.set()
+
+        for job in jobs:
+            job.result()
+
+        self.assertEqual(order, range(10))
+
+    def test_result_reraises_what_the_job_raised(self):
+        job = self.pool.submit(int, "not a number")
+
+        self.assertRaises(ValueError, job.result)
+
+    def test_shutdown_drains_queued_jobs(self):
+        release = self.hold()
+        order = []
+        for index in range(3):
+            self.pool.submit(order.append, index)
+        release.set()
+
+        self.pool.shutdown()
+        self.assertEqual(order, [0, 1, 2])
+        self.pool = WorkerPool(1)
+
+
+if __name__ == "__main__":
+    unittest.main()